@@ -1,22 +1,45 @@
-from flask import Flask, request, jsonify, redirect, render_template_string, send_file, make_response, send_from_directory
-import googlemaps
-import requests
-import pandas as pd
+from dotenv import load_dotenv
+
+# Charger les variables d'environnement avant les modules qui lisent leur configuration
+load_dotenv()
+
+from flask import Flask, request, jsonify, redirect, render_template_string, send_file, send_from_directory, Response, stream_with_context
 from datetime import datetime
+import contextvars
+import logging
+import math
 import os
 import time
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from dotenv import load_dotenv
+import uuid
 from functools import lru_cache
-import io
+import json
 from flask_cors import CORS
+from clients import get_gmaps, get_notion_client, get_gspread_client, GOOGLE_MAPS_API_KEY, CREDENTIALS_FILE
 from notion_export import NotionExporter
-from notion_client import Client
+from sheets_export import append_prospects_sheet, write_prospects_sheet
+from csv_export import iter_csv, iter_gzip, iter_archived, iter_completed, archive_path
+from export_manifest import export_manifest, parse_since
+from notion_index import get_export_index
+from details_cache import details_cache, get_place_details
+from gazetteer import gazetteer, geocode_cache, geocode_city
 from constants import KEYWORD_SUGGESTIONS
+from taxonomy import suggestions_json, SUGGESTIONS_LIMIT
+from text_utils import normalize_text
+from worker_pool import bounded_map, bounded_imap_unordered, pipelined_imap_unordered
+from nearby_search import (iter_nearby_pages, iter_tiled_places, limited_nearby_client, CallBudgetExceeded,
+                           NEARBY_RESULTS_CAP, TILED_SEARCH_CONCURRENCY)
+from geo import haversine_m
+from place_store import place_store, tile_contains, tile_grid
+from ranking import distances_km, parse_ranking_params, rank_results
+from response_format import compress_response, parse_projection, project, remember_results, resolve_results, results_cache, shape_results
+from jobs import JobManager
+from response_cache import SearchResponseCache, search_cache_key
+from quota import quota_manager, current_budget, QuotaExceeded
+import upstream
+from metrics import configure_logging, log_fields, render_prometheus, span, record_cache, request_id_var, http_requests, http_duration
 
-# Charger les variables d'environnement
-load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
@@ -31,156 +54,553 @@ def add_security_headers(response):
     response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
     return response
 
-# Configuration des APIs
-GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+@app.after_request
+def compress(response):
+    return compress_response(response, request.headers.get('Accept-Encoding'))
+
+def request_user():
+    # Identifiant utilisé pour le budget quotidien : en-tête explicite, sinon IP du client
+    forwarded = request.headers.get('X-Forwarded-For', '')
+    return request.headers.get('X-User-ID') or forwarded.split(',')[0].strip() or request.remote_addr
+
+# Routes soumises au délai global REQUEST_DEADLINE_S
+DEADLINE_ENDPOINTS = ('recherche_google', 'search', 'place_details_batch')
 
-# Configuration Google Sheets
-SCOPES = ['https://spreadsheets.google.com/feeds',
-          'https://www.googleapis.com/auth/drive']
-CREDENTIALS_FILE = 'credentials.json'
+@app.before_request
+def start_request_timer():
+    request.environ['api_finder.started'] = time.perf_counter()
+    request_id_var.set(request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12])
+    quota_manager.start_request(request_user())
+    # Délai global pour les recherches synchrones ; exports, flux et lots n'en ont pas
+    upstream.start_request(upstream.REQUEST_DEADLINE_S if request.endpoint in DEADLINE_ENDPOINTS else None)
+
+@app.after_request
+def record_request_metrics(response):
+    # Pour les réponses streamées, la durée mesurée est celle du premier octet
+    started = request.environ.get('api_finder.started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_requests.inc(route=route, method=request.method, status=response.status_code)
+        http_duration.observe(time.perf_counter() - started, route=route)
+    response.headers['X-Request-ID'] = request_id_var.get() or ''
+    # Coût Google Maps de la requête (hors réponses streamées, qui le donnent dans leur résumé)
+    budget = current_budget.get()
+    if budget and (budget.calls or request.endpoint in ('recherche_google', 'recherche_google_batch', 'search', 'place_details_batch')) and not response.is_streamed:
+        summary = budget.summary()
+        response.headers['X-Search-Cost-USD'] = f"{summary['cost_usd']:.4f}"
+        response.headers['X-Search-Calls'] = ', '.join(f'{sku}={n}' for sku, n in sorted(summary['calls'].items()))
+        if summary['exhausted']:
+            response.headers['X-Quota-Exhausted'] = summary['exhausted']
+    degraded = upstream.degraded_places.get()
+    if degraded and not response.is_streamed:
+        response.headers['X-Degraded-Count'] = str(len(degraded))
+    return response
+
+def quota_exceeded_response(error):
+    budget = current_budget.get()
+    return jsonify({
+        "error": str(error),
+        "scope": error.scope,
+        "cost": budget.summary() if budget else None
+    }), 429
 
 # Configuration Notion
 NOTION_TOKEN = os.getenv('NOTION_TOKEN')
 NOTION_DATABASE_ID = os.getenv('NOTION_DATABASE_ID')
 
-# Initialiser le client Google Maps
-try:
-    if not GOOGLE_MAPS_API_KEY:
-        raise ValueError("La clé API Google Maps n'est pas définie")
-    gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
-    # Tester la connexion
-    gmaps.geocode("Paris")  # Test simple
-    print("✓ Client Google Maps initialisé avec succès")
-except Exception as e:
-    print(f"❌ Erreur d'initialisation Google Maps: {str(e)}")
-    raise
-
-def perform_search(keyword, city, radius):
+# Nombre de requêtes Place Details lancées en parallèle
+PLACES_CONCURRENCY = int(os.getenv('PLACES_CONCURRENCY', '8'))
+# Nombre maximum de lieux enrichis par appel à /api/details
+DETAILS_BATCH_MAX = int(os.getenv('DETAILS_BATCH_MAX', '100'))
+# Recherche en lot (mots-clés × communes) : combinaisons maximum, recherches
+# Nearby en parallèle et budget Google Maps de la requête (USD)
+BATCH_SEARCH_MAX_COMBINATIONS = int(os.getenv('BATCH_SEARCH_MAX_COMBINATIONS', '300'))
+BATCH_SEARCH_CONCURRENCY = int(os.getenv('BATCH_SEARCH_CONCURRENCY', '6'))
+# (sous le budget quotidien par utilisateur, QUOTA_USER_DAILY_BUDGET_USD = 25 $)
+BATCH_SEARCH_BUDGET_USD = float(os.getenv('BATCH_SEARCH_BUDGET_USD', '20'))
+# Budget Google Maps d'une recherche mode='tiled' ou 'local' (USD) : jusqu'à
+# TILED_SEARCH_MAX_CALLS appels Nearby (60 ≈ 1,92 $) et ~700 Place Details
+TILED_SEARCH_BUDGET_USD = float(os.getenv('TILED_SEARCH_BUDGET_USD', '20'))
+# Budget Google Maps d'un job de recherche en arrière-plan (USD)
+JOBS_BUDGET_USD = float(os.getenv('JOBS_BUDGET_USD', '10'))
+
+# Champs demandés à Place Details selon la route
+SEARCH_DETAILS_FIELDS = [
+    'name',
+    'formatted_address',
+    'formatted_phone_number',
+    'website',
+    'rating',
+    'user_ratings_total',
+    'opening_hours',
+    'business_status'
+]
+RECHERCHE_DETAILS_FIELDS = [
+    'name',
+    'formatted_address',
+    'formatted_phone_number',
+    'website',
+    'type',
+    'rating',
+    'user_ratings_total',
+    'opening_hours',
+    'business_status',
+    'price_level'
+]
+
+def enrich_place(place, fields, export_index=None):
+    # Récupère les détails d'un lieu et vérifie s'il est déjà dans Notion
     try:
-        print(f"Recherche pour: keyword='{keyword}', city='{city}', radius='{radius}km'")
-        
-        # Extraire les coordonnées si elles sont présentes dans la chaîne city
-        location_coords = None
-        if '[' in city and ']' in city:
-            try:
-                coords_str = city[city.index('[') + 1:city.index(']')]
-                lat, lng = map(float, coords_str.split(','))
-                location_coords = {'lat': lat, 'lng': lng}
-                city = city[:city.index('[')].strip()
-            except Exception as e:
-                print(f"Erreur lors de l'extraction des coordonnées: {str(e)}")
+        details = get_place_details(get_gmaps(), place['place_id'], fields)
+
+        entreprise = {
+            'id': str(place['place_id']),  # Utiliser place_id comme ID unique
+            'name': details.get('name', ''),
+            'address': details.get('formatted_address', ''),
+            'phone': details.get('formatted_phone_number', ''),
+            'website': details.get('website', ''),
+            'rating': details.get('rating', 'N/A'),
+            'total_ratings': details.get('user_ratings_total', '0'),
+            'opening_hours': details.get('opening_hours', {}).get('weekday_text', []),
+            'business_status': details.get('business_status', ''),
+            # Coordonnées du résultat Nearby, sinon de la fiche (champ geometry)
+            **place_coordinates(place if place.get('geometry') else details),
+            'enriched': True
+        }
+
+        # Vérifier si l'entreprise existe dans Notion (lookup dans l'index partagé)
+        entreprise['alreadyExported'] = bool(
+            export_index and export_index.is_exported(entreprise['name'], entreprise['id'])
+        )
+
+        return entreprise
+    except Exception as e:
+        logger.error(f"Error processing place: {str(e)}")
+        # Détails indisponibles (panne, délai, budget) : la ligne Nearby Search
+        # est servie quand même, marquée comme dégradée
+        if not place.get('name'):
+            return None
+        reason = 'quota' if isinstance(e, QuotaExceeded) else upstream.degradation_reason(e)
+        upstream.mark_degraded(place['place_id'], reason)
+        return dict(basic_place(place, export_index), degraded=reason)
+
+def place_coordinates(place):
+    location = place.get('geometry', {}).get('location', {})
+    return {'lat': location.get('lat'), 'lng': location.get('lng')}
+
+def basic_place(place, export_index=None):
+    # Entreprise construite à partir du seul résultat Nearby Search (mode
+    # details=lazy) : pas de téléphone, site ni horaires avant /api/details
+    entreprise = {
+        'id': str(place['place_id']),
+        'name': place.get('name', ''),
+        'address': place.get('vicinity', ''),
+        'phone': '',
+        'website': '',
+        'rating': place.get('rating', 'N/A'),
+        'total_ratings': place.get('user_ratings_total', '0'),
+        'opening_hours': [],
+        'business_status': place.get('business_status', ''),
+        **place_coordinates(place),
+        'enriched': False
+    }
+    entreprise['alreadyExported'] = bool(
+        export_index and export_index.is_exported(entreprise['name'], entreprise['id'])
+    )
+    return entreprise
+
+def notion_export_index():
+    # Index Notion partagé, rafraîchi au plus une fois par recherche
+    if not NOTION_TOKEN or not NOTION_DATABASE_ID:
+        return None
+    export_index = get_export_index(NOTION_TOKEN, NOTION_DATABASE_ID)
+    with span('notion_index'):
+        export_index.refresh()
+    return export_index
+
+def iter_place_batches(location_coords, radius, keyword, mode='nearby', stats=None):
+    # Lots de résultats Nearby Search : pages successives, ou tuiles en mode 'tiled'
+    if mode == 'tiled':
+        return iter_tiled_places(get_gmaps(), location_coords, radius, keyword, stats=stats)
+    return iter_nearby_pages(get_gmaps(), location_coords, radius, keyword)
+
+def store_place(entreprise, keyword):
+    # Toute entreprise enrichie alimente la base locale des lieux
+    if entreprise:
+        place_store.save([entreprise], keyword)
+    return entreprise
+
+def iter_stored(results, keyword):
+    # Comme store_place au fil d'un flux (position, entreprise), mais une
+    # seule transaction par lot de 20 entreprises (une page Nearby Search)
+    batch = []
+    try:
+        for index, entreprise in results:
+            if entreprise:
+                batch.append(entreprise)
+                if len(batch) >= 20:
+                    place_store.save(batch, keyword)
+                    batch = []
+            yield index, entreprise
+    finally:
+        if batch:
+            place_store.save(batch, keyword)
+
+def fetch_tile_places(tile, keyword, client):
+    # Parcourt une tuile de la grille locale et enregistre ses lieux (champs
+    # Nearby Search). Au plafond de 60 résultats, elle est découpée comme en
+    # mode 'tiled'. client (limited_nearby_client) porte le plafond d'appels
+    # commun à toutes les tuiles de la recherche ; une tuile interrompue par
+    # ce plafond ou par le budget est marquée partielle.
+    places = []
+    complete = True
+    try:
+        for page in iter_nearby_pages(client, tile['center'], tile['radius'], keyword):
+            places.extend(page)
+        if len(places) >= NEARBY_RESULTS_CAP:
+            # Les 60 résultats déjà payés sont gardés, complétés par les sous-cellules
+            tiled = {}
+            seen = {place['place_id'] for place in places}
+            for batch in iter_tiled_places(client, tile['center'], tile['radius'], keyword, stats=tiled):
+                for place in batch:
+                    if place['place_id'] not in seen:
+                        seen.add(place['place_id'])
+                        places.append(place)
+            complete = not tiled['truncated']
+    except (CallBudgetExceeded, QuotaExceeded):
+        complete = False
+    if client.quota_exceeded:
+        # Page suivante refusée par le budget (iter_nearby_pages s'arrête sans lever)
+        complete = False
+    if places:
+        entreprises = [basic_place(place) for place in places]
+        place_store.save([e for e in entreprises if e['lat'] is not None and tile_contains(tile, e)], keyword)
+        place_store.mark_covered(keyword, tile, len(places), complete)
+    return complete
+
+def iter_local_results(location_coords, radius, keyword, fields, stats=None):
+    # Mode 'local' : la zone est découpée en tuiles fixes ; seules les tuiles
+    # jamais parcourues ou périmées pour ce mot-clé sont demandées à Google,
+    # puis la réponse est lue dans la base locale par requête de rayon.
+    # Les fiches pas encore enrichies (ou périmées) passent par Place Details.
+    stats = stats if stats is not None else {}
+    tiles = tile_grid(location_coords, radius)
+    missing = place_store.missing_tiles(keyword, tiles)
+    client = limited_nearby_client(get_gmaps())
+    with span('local_tiles', tiles=len(tiles), missing=len(missing)):
+        complete = bounded_map(lambda tile: fetch_tile_places(tile, keyword, client), missing,
+                               max_workers=TILED_SEARCH_CONCURRENCY)
+    stats.update({'tiles': len(tiles), 'fetched': len(missing), 'incomplete': sum(1 for c in complete if not c),
+                  'calls': client.calls})
+
+    export_index = notion_export_index()
+    entreprises = place_store.query(keyword, location_coords, radius)
+    pending = []
+    for index, entreprise in enumerate(entreprises):
+        if fields and not entreprise['enriched']:
+            pending.append(index)
+            continue
+        yield index, dict(entreprise, alreadyExported=bool(
+            export_index and export_index.is_exported(entreprise['name'], entreprise['id'])
+        ))
+
+    def refresh(index):
+        entreprise = entreprises[index]
+        place = {'place_id': entreprise['id'], 'name': entreprise['name'], 'vicinity': entreprise['address'],
+                 'geometry': {'location': {'lat': entreprise['lat'], 'lng': entreprise['lng']}}}
+        return enrich_place(place, fields, export_index)
+
+    refreshed = bounded_imap_unordered(refresh, pending, max_workers=PLACES_CONCURRENCY)
+    for position, entreprise in iter_stored(refreshed, keyword):
+        yield pending[position], entreprise
+
+def iter_search_results(location_coords, radius, keyword, fields, mode='nearby', stats=None):
+    # Pagination Nearby Search et Place Details en pipeline : les détails de
+    # la page N sont récupérés pendant l'attente du token de la page N+1.
+    # Produit des couples (position dans les résultats Google, entreprise ou None).
+    # Sans fields (details=lazy), seuls les champs Nearby Search sont renvoyés.
+    if mode == 'local':
+        return iter_local_results(location_coords, radius, keyword, fields, stats)
+    export_index = notion_export_index()
+    pages = iter_place_batches(location_coords, radius, keyword, mode, stats)
+    if not fields:
+        places = (place for page in pages for place in page)
+        return ((index, basic_place(place, export_index)) for index, place in enumerate(places))
+    return iter_stored(pipelined_imap_unordered(
+        lambda place: enrich_place(place, fields, export_index),
+        pages,
+        max_workers=PLACES_CONCURRENCY
+    ), keyword)
+
+def search_places(location_coords, radius, keyword, fields, mode='nearby'):
+    # Toutes les entreprises trouvées, dans l'ordre renvoyé par Google
+    results = sorted(iter_search_results(location_coords, radius, keyword, fields, mode), key=lambda item: item[0])
+    return [entreprise for _, entreprise in results if entreprise]
+
+# Réponses de recherche complètes (stale-while-revalidate, single-flight)
+search_cache = SearchResponseCache()
+
+def bypass_search_cache():
+    # "Cache-Control: no-cache" force une nouvelle recherche auprès de Google
+    return 'no-cache' in request.headers.get('Cache-Control', '')
+
+def cached_search_places(location_coords, radius, keyword, fields, mode='nearby', bypass=False):
+    # search_places derrière le cache de réponses. Retourne (entreprises, statut du cache).
+    key = search_cache_key(keyword, location_coords, radius, fields or (), mode)
+    def compute():
+        with span('search', keyword=keyword, radius=radius, mode=mode):
+            entreprises = search_places(location_coords, radius, keyword, fields, mode)
+        # Les routes d'export et /api/details peuvent ensuite ne recevoir que
+        # les place_ids ; la distance au centre de recherche est conservée
+        distances = distances_km(entreprises, location_coords) if entreprises else []
+        remember_results(
+            dict(entreprise, distance_km=None if math.isnan(distance) else round(float(distance), 3))
+            for entreprise, distance in zip(entreprises, distances)
+        )
+        return entreprises
+
+    def complete(entreprises):
+        # Une recherche interrompue par le budget, ou dont des lieux sont
+        # dégradés, est servie mais pas mise en cache
+        budget = current_budget.get()
+        return not (budget and budget.exhausted) and not any(e.get('degraded') for e in entreprises)
+
+    entreprises, cache_status = search_cache.get_or_compute(key, compute, bypass=bypass, keep=complete)
+    record_cache('search_responses', cache_status)
+    # L'état d'export Notion peut avoir changé depuis la mise en cache
+    export_index = notion_export_index()
+    return [
+        dict(entreprise, alreadyExported=bool(
+            export_index and export_index.is_exported(entreprise['name'], entreprise['id'])
+        ))
+        for entreprise in entreprises
+    ], cache_status
+
+def parse_city_coords(city):
+    # Extraire les coordonnées si elles sont présentes dans la chaîne city ("Ville [lat,lng]")
+    if '[' in city and ']' in city:
+        try:
+            coords_str = city[city.index('[') + 1:city.index(']')]
+            lat, lng = map(float, coords_str.split(','))
+            return city[:city.index('[')].strip(), {'lat': lat, 'lng': lng}
+        except Exception as e:
+            logger.error(f"Erreur lors de l'extraction des coordonnées: {str(e)}")
+    return city, None
+
+def stream_frame(frame_type, payload, fmt):
+    # Une ligne NDJSON, ou un événement Server-Sent Events
+    if fmt == 'sse':
+        return f"event: {frame_type}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    return json.dumps({"type": frame_type, "data": payload}, ensure_ascii=False) + "\n"
+
+def stream_search_response(keyword, location_coords, radius, fields, mode, timings, ranking=None, projection=None):
+    # Réponse streamée : chaque entreprise dès que prête, puis un résumé.
+    # Les filtres de ranking s'appliquent ligne à ligne ; le tri n'a pas de sens en flux.
+    filters = {k: v for k, v in (ranking or {}).items() if k != 'sort'}
+    projected = (projection or {}).get('fields')
+    wants_sse = request.args.get('format') == 'sse' or 'text/event-stream' in request.headers.get('Accept', '')
+    fmt = 'sse' if wants_sse else 'ndjson'
+    started = time.monotonic()
+    budget = current_budget.get()
+
+    def generate():
+        current_budget.set(budget)
+        found = count = already_exported = filtered = degraded = 0
+        tiles = {}
+        sent = []
+        try:
+            with span('search', keyword=keyword, radius=radius, mode=mode, streamed=True):
+                for _, entreprise in iter_search_results(location_coords, radius, keyword, fields, mode, tiles):
+                    found += 1
+                    if not entreprise:
+                        continue
+                    ranked = rank_results([entreprise], location_coords, radius, filters)
+                    if not ranked:
+                        filtered += 1
+                        continue
+                    entreprise = ranked[0]
+                    if count == 0:
+                        timings['first_result_ms'] = round((time.monotonic() - started) * 1000)
+                    count += 1
+                    already_exported += entreprise['alreadyExported']
+                    degraded += bool(entreprise.get('degraded'))
+                    sent.append(entreprise)
+                    yield stream_frame('result', project(entreprise, projected), fmt)
+        except QuotaExceeded as e:
+            yield stream_frame('error', {"error": str(e), "scope": e.scope, "cost": budget.summary()}, fmt)
+            return
+        except Exception as e:
+            logger.error(f"Places API error: {str(e)}")
+            yield stream_frame('error', {"error": "Error during places API call"}, fmt)
+            return
+
+        timings['total_ms'] = round((time.monotonic() - started) * 1000) + timings.get('geocode_ms', 0)
+        summary = {
+            "found": found,
+            "count": count,
+            "failed": found - count - filtered,
+            "filtered": filtered,
+            "degraded": degraded,
+            "alreadyExported": already_exported,
+            "timings": timings,
+            "cost": budget.summary() if budget else None
+        }
+        if mode in ('tiled', 'local'):
+            summary['tiles'] = tiles
+        remember_results(sent)
+        yield stream_frame('summary', summary, fmt)
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream' if fmt == 'sse' else 'application/x-ndjson'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def perform_search(keyword, city, radius, mode='nearby', fields=SEARCH_DETAILS_FIELDS, ranking=None):
+    try:
+        logger.info("Recherche", extra=log_fields(keyword=keyword, city=city, radius_km=radius, mode=mode))
+
+        city, location_coords = parse_city_coords(city)
 
         # Si pas de coordonnées, faire le géocodage
         if not location_coords:
             try:
-                geocode_result = gmaps.geocode(city)
-                if not geocode_result:
+                with span('geocode', city=city):
+                    location_coords = geocode_city(get_gmaps(), city)
+                if not location_coords:
                     return []
-                location_coords = geocode_result[0]['geometry']['location']
             except Exception as e:
-                print(f"Erreur lors du géocodage: {str(e)}")
+                logger.error(f"Erreur lors du géocodage: {str(e)}")
                 return []
 
-        # Liste pour stocker tous les résultats
-        all_results = []
-        
-        # Premier appel à l'API
-        places_result = gmaps.places_nearby(
-            location=location_coords,
-            radius=int(radius) * 1000,  # conversion en mètres
-            keyword=keyword
-        )
-        
-        if 'results' in places_result:
-            all_results.extend(places_result['results'])
-            
-            # Récupérer les pages suivantes s'il y en a
-            while 'next_page_token' in places_result:
-                time.sleep(2)  # Attendre que le token soit valide
-                places_result = gmaps.places_nearby(
-                    location=location_coords,
-                    radius=int(radius) * 1000,
-                    keyword=keyword,
-                    page_token=places_result['next_page_token']
-                )
-                if places_result.get('results'):
-                    all_results.extend(places_result['results'])
-
-        entreprises = []
-        for place in all_results:
-            try:
-                details = gmaps.place(place['place_id'], fields=[
-                    'name',
-                    'formatted_address',
-                    'formatted_phone_number',
-                    'website',
-                    'rating',
-                    'user_ratings_total',
-                    'opening_hours',
-                    'business_status'
-                ])['result']
-                
-                entreprise = {
-                    'id': str(place['place_id']),
-                    'name': details.get('name', ''),
-                    'address': details.get('formatted_address', ''),
-                    'phone': details.get('formatted_phone_number', ''),
-                    'website': details.get('website', ''),
-                    'rating': details.get('rating', 'N/A'),
-                    'total_ratings': details.get('user_ratings_total', '0'),
-                    'opening_hours': details.get('opening_hours', {}).get('weekday_text', []),
-                    'business_status': details.get('business_status', '')
-                }
-
-                # Vérifier si l'entreprise existe dans Notion
-                try:
-                    if NOTION_TOKEN and NOTION_DATABASE_ID:
-                        exporter = NotionExporter(NOTION_TOKEN, NOTION_DATABASE_ID)
-                        existing_pages = exporter.notion.databases.query(
-                            database_id=NOTION_DATABASE_ID,
-                            filter={
-                                "property": "Name",
-                                "title": {
-                                    "equals": entreprise['name']
-                                }
-                            }
-                        )
-                        entreprise['alreadyExported'] = bool(existing_pages.get('results'))
-                except Exception as e:
-                    print(f"Erreur lors de la vérification Notion: {str(e)}")
-                    entreprise['alreadyExported'] = False
-                
-                entreprises.append(entreprise)
-            except Exception as e:
-                print(f"Error processing place: {str(e)}")
-                continue
+        radius_m = int(radius) * 1000  # conversion en mètres
+        entreprises, _ = cached_search_places(location_coords, radius_m, keyword, fields, mode,
+                                              bypass=bypass_search_cache())
 
-        return entreprises
+        return rank_results(entreprises, location_coords, radius_m, ranking)
 
     except Exception as e:
-        print(f"Erreur détaillée dans perform_search: {str(e)}")
-        print(f"Paramètres reçus: keyword='{keyword}', city='{city}', radius='{radius}'")
+        logger.error(f"Erreur détaillée dans perform_search: {str(e)}")
+        logger.info(f"Paramètres reçus: keyword='{keyword}', city='{city}', radius='{radius}'")
         return []
 
 @app.route('/suggestions', methods=['GET', 'POST'])
 def get_suggestions():
-    return jsonify(KEYWORD_SUGGESTIONS)
+    # Sans q : toute la taxonomie ; avec q : autocomplétion des mots-clés.
+    # Corps JSON précalculés, revalidés par ETag (304 si inchangés).
+    try:
+        limit = min(int(request.args.get('limit', SUGGESTIONS_LIMIT)), 50)
+    except ValueError:
+        return jsonify({"error": "limit doit être un entier"}), 400
+    body, etag = suggestions_json(normalize_text(request.args.get('q', '')), limit)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=300'
+    return response.make_conditional(request)
+
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "place_details": details_cache.stats(),
+        "geocode": geocode_cache.stats(),
+        "search_responses": search_cache.stats(),
+        "place_store": place_store.stats(),
+        "results": results_cache.stats(),
+        "export_manifest": export_manifest.stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Format d'exposition Prometheus (compteurs du processus worker courant)
+    return Response(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/quota', methods=['GET'])
+def quota_usage():
+    # Dépense Google Maps du mois et de l'utilisateur pour la journée
+    return jsonify(quota_manager.usage(request_user()))
+
+@app.route('/api/communes', methods=['GET'])
+def communes():
+    # Autocomplétion des communes belges à partir du gazetteer local
+    query = request.args.get('q', '')
+    try:
+        limit = min(int(request.args.get('limit', 10)), 50)
+    except ValueError:
+        return jsonify({"error": "limit doit être un entier"}), 400
+    return jsonify(gazetteer.suggest(query, limit=limit))
+
+def read_recherche_params():
+    # mode='tiled' active la recherche par tuiles au-delà du plafond de 60 résultats,
+    # mode='local' répond depuis la base locale des lieux pour les zones déjà couvertes
+    if request.method == 'POST':
+        data = request.get_json()
+        keyword = data.get('keyword', '')
+        city = data.get('city', '')
+        radius_km = data.get('radius', 5)
+        mode = data.get('mode', 'nearby')
+    else:  # GET method
+        keyword = request.args.get('keyword', '')
+        city = request.args.get('city', '')
+        radius_km = int(request.args.get('radius', 5))
+        mode = request.args.get('mode', 'nearby')
+    return keyword, city, radius_km, mode
+
+def ranking_params():
+    # Tri et filtres côté serveur (voir ranking.py) ; ValueError si invalides
+    if request.method == 'POST':
+        return parse_ranking_params(request.get_json(silent=True) or {})
+    return parse_ranking_params(request.args)
+
+def projection_params():
+    # fields=id,name,... et layout=columns (voir response_format.py) ; ValueError si invalides
+    source = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    return parse_projection(source.get('fields'), source.get('layout'))
+
+def details_fields(default=RECHERCHE_DETAILS_FIELDS):
+    # details=lazy : réponse immédiate avec les champs Nearby Search, les
+    # détails des lignes retenues sont demandés ensuite à /api/details
+    if request.method == 'POST':
+        details = (request.get_json(silent=True) or {}).get('details')
+    else:
+        details = request.args.get('details')
+    return None if details == 'lazy' else default
+
+def start_search_budget(mode):
+    # Les modes 'tiled' et 'local' enchaînent des dizaines d'appels Nearby :
+    # budget propre, comme la recherche en lot
+    if mode in ('tiled', 'local'):
+        quota_manager.start_request(request_user(), TILED_SEARCH_BUDGET_USD)
+
+def resolve_recherche_location(city):
+    # Retourne (coordonnées, réponse d'erreur)
+    try:
+        logger.info(f"🔍 Début du géocodage pour: {city}")
+        with span('geocode', city=city):
+            location_coords = geocode_city(get_gmaps(), city, country='Belgium')
+
+        if not location_coords:
+            logger.warning("❌ Aucun résultat trouvé pour cette localisation")
+            return None, (jsonify({"error": f"Localisation '{city}, Belgium' non trouvée"}), 400)
+
+        logger.info(f"✓ Coordonnées trouvées: {location_coords}")
+        return location_coords, None
+
+    except QuotaExceeded as e:
+        return None, quota_exceeded_response(e)
+    except Exception as e:
+        logger.error(f"❌ Erreur détaillée de géocodage: {str(e)}")
+        logger.error(f"Type d'erreur: {type(e).__name__}")
+        return None, (jsonify({"error": f"Erreur lors du géocodage: {str(e)}"}), 400)
 
 @app.route('/api/recherche-google', methods=['GET', 'POST'])
 def recherche_google():
     try:
         # Get and validate parameters
-        if request.method == 'POST':
-            data = request.get_json()
-            keyword = data.get('keyword', '')
-            city = data.get('city', '')
-            radius_km = data.get('radius', 5)
-        else:  # GET method
-            keyword = request.args.get('keyword', '')
-            city = request.args.get('city', '')
-            radius_km = int(request.args.get('radius', 5))
-        
-        print(f"Recherche demandée - Mot-clé: {keyword}, Ville: {city}, Rayon: {radius_km}km")
+        keyword, city, radius_km, mode = read_recherche_params()
+
+        logger.info("Recherche demandée", extra=log_fields(keyword=keyword, city=city, radius_km=radius_km, mode=mode))
         
         if not keyword or not city:
             return jsonify({"error": "Keyword and city are required"}), 400
@@ -190,154 +610,436 @@ def recherche_google():
         except ValueError:
             return jsonify({"error": "Radius must be a number"}), 400
 
-        # Géocodage
         try:
-            print(f"🔍 Début du géocodage pour: {city}")
-            # Essayons avec le pays spécifié
-            city_with_country = f"{city}, Belgium"
-            print(f"🌍 Tentative avec ville + pays: {city_with_country}")
-            
-            geocode_result = gmaps.geocode(city_with_country)
-            print(f"📍 Résultat brut du géocodage: {geocode_result}")
-            
-            if not geocode_result:
-                print("❌ Aucun résultat trouvé pour cette localisation")
-                return jsonify({"error": f"Localisation '{city_with_country}' non trouvée"}), 400
-                
-            location_coords = geocode_result[0]['geometry']['location']
-            print(f"✓ Coordonnées trouvées: {location_coords}")
-            
-            # Ajout des coordonnées manuelles de Musson si le géocodage échoue
-            if not location_coords and city.lower() == "musson":
-                print("ℹ️ Utilisation des coordonnées manuelles pour Musson")
-                location_coords = {'lat': 49.5667, 'lng': 5.5333}
-            
-        except Exception as e:
-            print(f"❌ Erreur détaillée de géocodage: {str(e)}")
-            print(f"Type d'erreur: {type(e).__name__}")
-            return jsonify({"error": f"Erreur lors du géocodage: {str(e)}"}), 400
+            ranking = ranking_params()
+            projection = projection_params()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Liste pour stocker tous les résultats
-        all_results = []
-        
-        # Premier appel à l'API
+        start_search_budget(mode)
+        # Géocodage
+        location_coords, error = resolve_recherche_location(city)
+        if error:
+            return error
+
+        # Recherche paginée (jusqu'à 60 résultats) et détails en pipeline
         try:
-            places_result = gmaps.places_nearby(
-                location=location_coords,
-                radius=radius,
-                keyword=keyword
-            )
-            
-            if 'results' in places_result:
-                all_results.extend(places_result['results'])
+            entreprises, cache_status = cached_search_places(location_coords, radius, keyword, details_fields(), mode,
+                                                             bypass=bypass_search_cache())
+        except QuotaExceeded as e:
+            return quota_exceeded_response(e)
+        except upstream.UpstreamError as e:
+            # Coupe-circuit ouvert ou délai épuisé : inutile de réessayer tout de suite
+            logger.error(f"Places API indisponible: {str(e)}")
+            return jsonify({"error": str(e), "service": e.service}), 503
         except Exception as e:
-            print(f"Places API error: {str(e)}")
+            logger.error(f"Places API error: {str(e)}")
             return jsonify({"error": "Error during places API call"}), 400
 
-        entreprises = []
-        for idx, place in enumerate(all_results):
-            try:
-                details = gmaps.place(place['place_id'], fields=[
-                    'name',
-                    'formatted_address',
-                    'formatted_phone_number',
-                    'website',
-                    'type',
-                    'rating',
-                    'user_ratings_total',
-                    'opening_hours',
-                    'business_status',
-                    'price_level'
-                ])['result']
-                
-                entreprise = {
-                    'id': str(place['place_id']),  # Utiliser place_id comme ID unique
-                    'name': details.get('name', ''),
-                    'address': details.get('formatted_address', ''),
-                    'phone': details.get('formatted_phone_number', ''),
-                    'website': details.get('website', ''),
-                    'rating': details.get('rating', 'N/A'),
-                    'total_ratings': details.get('user_ratings_total', '0'),
-                    'opening_hours': details.get('opening_hours', {}).get('weekday_text', []),
-                    'business_status': details.get('business_status', '')
-                }
-                
-                # Vérifier si l'entreprise existe dans Notion
-                try:
-                    exporter = NotionExporter(NOTION_TOKEN, NOTION_DATABASE_ID)
-                    existing_pages = exporter.notion.databases.query(
-                        database_id=NOTION_DATABASE_ID,
-                        filter={
-                            "property": "Name",
-                            "title": {
-                                "equals": entreprise['name']
-                            }
-                        }
-                    )
-                    entreprise['alreadyExported'] = bool(existing_pages.get('results'))
-                except Exception as e:
-                    print(f"Erreur lors de la vérification Notion: {str(e)}")
-                    entreprise['alreadyExported'] = False
-                
-                entreprises.append(entreprise)
-            except Exception as e:
-                print(f"Error processing place: {str(e)}")
+        response = jsonify(shape_results(rank_results(entreprises, location_coords, radius, ranking), projection))
+        response.headers['X-Search-Cache'] = cache_status
+        return response
+
+    except Exception as e:
+        logger.error(f"Erreur: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/recherche-google/stream', methods=['GET', 'POST'])
+def recherche_google_stream():
+    try:
+        keyword, city, radius_km, mode = read_recherche_params()
+
+        if not keyword or not city:
+            return jsonify({"error": "Keyword and city are required"}), 400
+
+        try:
+            radius = int(float(radius_km)) * 1000  # conversion en mètres
+        except ValueError:
+            return jsonify({"error": "Radius must be a number"}), 400
+
+        try:
+            ranking = ranking_params()
+            projection = projection_params()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        start_search_budget(mode)
+        geocode_started = time.monotonic()
+        location_coords, error = resolve_recherche_location(city)
+        if error:
+            return error
+        timings = {'geocode_ms': round((time.monotonic() - geocode_started) * 1000)}
+
+        return stream_search_response(keyword, location_coords, radius, details_fields(), mode, timings, ranking, projection)
+
+    except Exception as e:
+        logger.error(f"Erreur: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def read_batch_keywords(data):
+    # Mots-clés explicites et/ou catégories de KEYWORD_SUGGESTIONS, sans doublons.
+    # ValueError si les listes ne contiennent pas que du texte.
+    keywords = data.get('keywords') or []
+    categories = data.get('categories') or ([data['category']] if data.get('category') else [])
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    if isinstance(categories, str):
+        categories = [categories]
+    if not isinstance(keywords, list) or not all(isinstance(keyword, str) for keyword in keywords):
+        raise ValueError("keywords doit être une liste de textes")
+    if not isinstance(categories, list) or not all(isinstance(category, str) for category in categories):
+        raise ValueError("categories doit être une liste de textes")
+    keywords = list(keywords)
+    for category in categories:
+        if category not in KEYWORD_SUGGESTIONS:
+            raise ValueError(f"Catégorie inconnue '{category}'")
+        keywords.extend(KEYWORD_SUGGESTIONS[category]['keywords'])
+    return list(dict.fromkeys(keyword.strip() for keyword in keywords if keyword and keyword.strip()))
+
+def read_batch_cities(data):
+    # Communes sans doublons ; une commune seule peut être passée en texte.
+    # ValueError si la liste ne contient pas que du texte.
+    cities = data.get('cities') or []
+    if isinstance(cities, str):
+        cities = [cities]
+    if not isinstance(cities, list) or not all(isinstance(city, str) for city in cities):
+        raise ValueError("cities doit être une liste de textes")
+    return list(dict.fromkeys(city.strip() for city in cities if city and city.strip()))
+
+def geocode_batch_city(city):
+    name, location_coords = parse_city_coords(city)
+    return location_coords or geocode_city(get_gmaps(), name, country='Belgium')
+
+@app.route('/api/recherche-google/batch', methods=['POST'])
+def recherche_google_batch():
+    # Toutes les combinaisons mots-clés × communes en une requête : chaque
+    # commune est géocodée une fois, les recherches Nearby tournent en
+    # parallèle sous limite, et un lieu trouvé par plusieurs combinaisons
+    # n'est enrichi qu'une fois. Chaque entreprise porte la liste des
+    # mots-clés et des communes qui l'ont trouvée.
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            keywords = read_batch_keywords(data)
+            cities = read_batch_cities(data)
+            radius = int(float(data.get('radius', 5))) * 1000
+            ranking = ranking_params()
+            projection = projection_params()
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        mode = data.get('mode', 'nearby')
+        fields = details_fields()
+
+        if not keywords or not cities:
+            return jsonify({"error": "keywords (ou category) et cities sont requis"}), 400
+        if mode not in ('nearby', 'tiled'):
+            return jsonify({"error": "mode doit valoir 'nearby' ou 'tiled'"}), 400
+        if len(keywords) * len(cities) > BATCH_SEARCH_MAX_COMBINATIONS:
+            return jsonify({"error": f"{BATCH_SEARCH_MAX_COMBINATIONS} combinaisons maximum par lot"}), 400
+
+        # Budget propre au lot : plusieurs centaines d'appels Nearby sont attendus
+        budget = quota_manager.start_request(request_user(), BATCH_SEARCH_BUDGET_USD)
+        logger.info("Recherche en lot", extra=log_fields(keywords=len(keywords), cities=len(cities), radius=radius, mode=mode))
+
+        with span('geocode_batch', cities=len(cities)):
+            locations = dict(zip(cities, bounded_map(geocode_batch_city, cities, max_workers=BATCH_SEARCH_CONCURRENCY)))
+        combinations = [(keyword, city) for keyword in keywords for city in cities if locations[city]]
+        searches = [{"keyword": keyword, "city": city, "found": 0} for keyword, city in combinations]
+
+        tags = {}
+        def search_combination(combination):
+            keyword, city = combination
+            return [place for batch in iter_place_batches(locations[city], radius, keyword, mode) for place in batch]
+
+        def new_places():
+            # Lots de lieux inédits, au fil des recherches terminées
+            for index, places in bounded_imap_unordered(search_combination, combinations, max_workers=BATCH_SEARCH_CONCURRENCY):
+                keyword, city = combinations[index]
+                if places is None:
+                    searches[index]['error'] = "Erreur lors de la recherche"
+                    continue
+                searches[index]['found'] = len(places)
+                batch = []
+                for place in places:
+                    entry = tags.get(place['place_id'])
+                    if entry is None:
+                        entry = tags[place['place_id']] = {'place': place, 'keywords': [], 'cities': []}
+                        batch.append(place)
+                    if keyword not in entry['keywords']:
+                        entry['keywords'].append(keyword)
+                    if city not in entry['cities']:
+                        entry['cities'].append(city)
+                yield batch
+
+        export_index = notion_export_index()
+        def build(place):
+            if not fields:
+                return basic_place(place, export_index)
+            return enrich_place(place, fields, export_index)
+
+        with span('search_batch', combinations=len(combinations), mode=mode):
+            built = sorted(pipelined_imap_unordered(build, new_places(), max_workers=PLACES_CONCURRENCY),
+                           key=lambda item: item[0])
+
+        results = []
+        enriched = {}
+        for _, entreprise in built:
+            if not entreprise:
                 continue
+            entry = tags[entreprise['id']]
+            if entreprise['enriched']:
+                for keyword in entry['keywords']:
+                    enriched.setdefault(keyword, []).append(entreprise)
+            results.append(dict(entreprise, keywords=entry['keywords'], cities=entry['cities']))
+        # Une transaction par mot-clé dans la base locale des lieux
+        for keyword, entreprises in enriched.items():
+            place_store.save(entreprises, keyword)
+
+        # Distance mesurée depuis la plus proche des communes qui ont trouvé le lieu
+        origins = [
+            min((locations[city] for city in entreprise['cities']),
+                key=lambda loc: haversine_m(loc['lat'], loc['lng'], entreprise['lat'], entreprise['lng'])
+                if entreprise['lat'] is not None else 0)
+            for entreprise in results
+        ]
+        ranked = rank_results(results, origins, radius, ranking)
+        remember_results(ranked)
+
+        total_found = sum(search['found'] for search in searches)
+        return jsonify({
+            "results": shape_results(ranked, projection),
+            "searches": searches,
+            "unresolved_cities": [city for city in cities if not locations[city]],
+            "stats": {
+                "combinations": len(combinations),
+                "places_found": total_found,
+                "unique_places": len(tags),
+                "duplicates": total_found - len(tags),
+                "degraded": sum(1 for entreprise in ranked if entreprise.get('degraded'))
+            },
+            "cost": budget.summary()
+        })
+
+    except Exception as e:
+        logger.error(f"Erreur lors de la recherche en lot: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/details', methods=['GET', 'POST'])
+def place_details_batch():
+    # Enrichit uniquement les lignes sélectionnées après une recherche details=lazy
+    try:
+        if request.method == 'POST':
+            place_ids = (request.get_json(silent=True) or {}).get('place_ids', [])
+        else:  # GET method
+            place_ids = [place_id for place_id in request.args.get('place_ids', '').split(',') if place_id]
+
+        # Dédoublonnage en gardant l'ordre de la sélection
+        place_ids = list(dict.fromkeys(str(place_id) for place_id in place_ids))
+        if not place_ids:
+            return jsonify({"error": "place_ids est requis"}), 400
+        if len(place_ids) > DETAILS_BATCH_MAX:
+            return jsonify({"error": f"{DETAILS_BATCH_MAX} lieux maximum par appel"}), 400
+        try:
+            projection = projection_params()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Chaque ligne repart de la ligne de recherche mise en cache
+        # (coordonnées, distance) ; un lieu inconnu demande aussi geometry
+        cached, _ = resolve_results(place_ids)
+        cached = {entreprise['id']: entreprise for entreprise in cached}
+        export_index = notion_export_index()
+
+        def details_row(place_id):
+            row = cached.get(place_id)
+            if not row or row.get('lat') is None:
+                return enrich_place({'place_id': place_id}, RECHERCHE_DETAILS_FIELDS + ['geometry'], export_index)
+            place = {
+                'place_id': place_id,
+                'name': row.get('name'),
+                'vicinity': row.get('address'),
+                'rating': row.get('rating'),
+                'user_ratings_total': row.get('total_ratings'),
+                'business_status': row.get('business_status'),
+                'geometry': {'location': {'lat': row['lat'], 'lng': row['lng']}}
+            }
+            entreprise = enrich_place(place, RECHERCHE_DETAILS_FIELDS, export_index)
+            return entreprise and dict(row, **entreprise)
+
+        with span('details_batch', count=len(place_ids)):
+            results = bounded_map(details_row, place_ids, max_workers=PLACES_CONCURRENCY)
+
+        remember_results(results)
+        place_store.save([entreprise for entreprise in results if entreprise and entreprise.get('enriched')])
+        return jsonify({
+            "results": shape_results([entreprise for entreprise in results if entreprise], projection),
+            "failed": [place_id for place_id, entreprise in zip(place_ids, results) if not entreprise]
+        })
+
+    except Exception as e:
+        logger.error(f"Erreur lors de l'enrichissement: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def find_job_places(params):
+    batches = iter_place_batches(params['location'], params['radius'], params['keyword'], params.get('mode', 'nearby'))
+    return [place for batch in batches for place in batch]
+
+# Index Notion du job en cours, chargé une fois par prepare_job
+job_export_index = contextvars.ContextVar('job_export_index', default=None)
+
+def enrich_job_place(place, params):
+    return store_place(enrich_place(place, RECHERCHE_DETAILS_FIELDS, job_export_index.get()), params['keyword'])
+
+def prepare_job(params):
+    # Un job est imputé à l'utilisateur qui l'a soumis, sous son propre plafond
+    quota_manager.start_request(params.get('user'), JOBS_BUDGET_USD)
+    job_export_index.set(notion_export_index())
+
+# Recherches longues exécutées hors requête (pour rester sous le timeout serverless)
+job_manager = JobManager(find_job_places, enrich_job_place, concurrency=PLACES_CONCURRENCY, prepare=prepare_job)
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    try:
+        keyword, city, radius_km, mode = read_recherche_params()
+
+        if not keyword or not city:
+            return jsonify({"error": "Keyword and city are required"}), 400
+
+        try:
+            radius = int(float(radius_km)) * 1000  # conversion en mètres
+        except ValueError:
+            return jsonify({"error": "Radius must be a number"}), 400
 
-        return jsonify(entreprises)
+        location_coords, error = resolve_recherche_location(city)
+        if error:
+            return error
+
+        job_id = job_manager.submit({
+            'keyword': keyword,
+            'city': city,
+            'radius': radius,
+            'mode': mode,
+            'location': location_coords,
+            'user': request_user()
+        })
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/api/jobs/{job_id}",
+            "results_url": f"/api/jobs/{job_id}/results"
+        }), 202
 
     except Exception as e:
-        print(f"Erreur: {str(e)}")
+        logger.error(f"Erreur lors de la création du job: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = job_manager.status(job_id)
+    if not status:
+        return jsonify({"error": "Job introuvable"}), 404
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    status = job_manager.status(job_id)
+    if not status:
+        return jsonify({"error": "Job introuvable"}), 404
+    return jsonify({
+        "status": status['status'],
+        "progress": status['progress'],
+        "results": job_manager.store.results(job_id)
+    })
+
+def read_export_results(data):
+    # Résultats envoyés en entier, ou seulement leurs place_ids, résolus dans
+    # le cache des résultats de recherche. Retourne (entreprises, place_ids introuvables).
+    results = data.get('results') or []
+    place_ids = data.get('place_ids') or []
+    if isinstance(place_ids, str):
+        place_ids = [place_id for place_id in place_ids.split(',') if place_id]
+    if results or not place_ids:
+        return results, []
+    return resolve_results(place_ids)
+
 @app.route('/api/export-csv', methods=['GET', 'POST'])
 def export_to_csv():
     try:
         if request.method == 'POST':
             data = request.get_json()
             keyword = data.get('keyword', '')
-            selected_results = data.get('results', [])
+            selected_results, missing = read_export_results(data)
+            compress = bool(data.get('gzip', False))
+            archive = bool(data.get('archive', False))
+            delta = bool(data.get('delta', False))
+            since = data.get('since')
+            destination = data.get('destination')
         else:  # GET method
             keyword = request.args.get('keyword', '')
-            selected_results = request.args.get('results', [])
+            selected_results, missing = read_export_results(request.args)
+            compress = request.args.get('gzip') in ('1', 'true')
+            archive = request.args.get('archive') in ('1', 'true')
+            delta = request.args.get('delta') in ('1', 'true')
+            since = request.args.get('since')
+            destination = request.args.get('destination')
 
-        if not selected_results:
-            return jsonify({"error": "Aucun résultat sélectionné"}), 400
+        try:
+            since = parse_since(since) if since not in (None, '') else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Créer un DataFrame pandas avec les résultats sélectionnés
-        df = pd.DataFrame(selected_results)
-        
-        # Réorganiser et renommer les colonnes pour plus de clarté
-        columns_mapping = {
-            'name': 'Nom',
-            'address': 'Adresse',
-            'phone': 'Téléphone',
-            'website': 'Site Web',
-            'rating': 'Note Google',
-            'total_ratings': 'Nombre d\'avis',
-            'business_status': 'Statut'
-        }
-        
-        # Ajouter le mot-clé pour chaque résultat
-        df['keyword'] = keyword
-        columns_mapping['keyword'] = 'Mot-clé recherché'
-        
-        df = df.rename(columns=columns_mapping)
-        df = df[columns_mapping.values()]  # Réorganiser les colonnes
+        unchanged = []
+        if since is not None:
+            # Fichier delta : entreprises exportées ou modifiées depuis la date
+            # (toutes destinations, ou celle demandée), toujours archivé dans backend/exports
+            selected_results = export_manifest.since(since, destination)
+            archive = True
+        elif not selected_results:
+            return jsonify({"error": "Aucun résultat sélectionné", "missing": missing}), 400
+        else:
+            if keyword:
+                selected_results = [dict(result, keyword=keyword) for result in selected_results]
+            if delta:
+                # Seules les entreprises nouvelles ou modifiées depuis le dernier export CSV
+                new, changed, unchanged = export_manifest.changes('csv', selected_results)
+                selected_results = new + [result for result, _ in changed]
+
+        # Le CSV est généré et envoyé ligne par ligne, sans copie complète en mémoire
+        chunks = iter_csv(selected_results, keyword)
+        if compress:
+            chunks = iter_gzip(chunks)
+
+        # Mode archive : une copie horodatée est écrite dans backend/exports
+        prefix = 'delta' if since is not None or delta else 'recherche'
+        path = archive_path(compress, prefix) if archive else None
+        if path:
+            chunks = iter_archived(chunks, path)
+        if since is None:
+            # Consigné dans le manifeste une fois le fichier entièrement envoyé
+            rows = selected_results
+            chunks = iter_completed(chunks, lambda: export_manifest.record('csv', ((row, None) for row in rows)))
+
+        filename = f"{prefix}_{keyword}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        response = Response(stream_with_context(chunks))
+        if compress:
+            response.headers["Content-Disposition"] = f"attachment; filename={filename}.gz"
+            response.headers["Content-type"] = "application/gzip"
+        else:
+            response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+            response.headers["Content-type"] = "text/csv; charset=utf-8-sig"
+        if path:
+            response.headers["X-Export-Archive"] = os.path.basename(path)
+        if missing:
+            response.headers["X-Export-Missing"] = str(len(missing))
+        response.headers["X-Export-Rows"] = str(len(selected_results))
+        if delta:
+            response.headers["X-Export-Unchanged"] = str(len(unchanged))
 
-        # Créer le fichier CSV en mémoire
-        output = io.StringIO()
-        df.to_csv(output, index=False, encoding='utf-8-sig')
-        
-        # Créer la réponse avec le bon type MIME
-        response = make_response(output.getvalue())
-        response.headers["Content-Disposition"] = f"attachment; filename=recherche_{keyword}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        response.headers["Content-type"] = "text/csv; charset=utf-8-sig"
-        
         return response
 
     except Exception as e:
-        print(f"Erreur lors de l'export CSV: {str(e)}")
+        logger.error(f"Erreur lors de l'export CSV: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/export-notion', methods=['GET', 'POST'])
@@ -346,38 +1048,37 @@ def export_to_notion():
         if request.method == 'POST':
             data = request.get_json()
             keyword = data.get('keyword', '')
-            selected_results = data.get('results', [])
+            selected_results, missing = read_export_results(data)
         else:  # GET method
             keyword = request.args.get('keyword', '')
-            selected_results = request.args.get('results', [])
+            selected_results, missing = read_export_results(request.args)
 
         if not selected_results:
-            return jsonify({"error": "Aucun résultat sélectionné"}), 400
+            return jsonify({"error": "Aucun résultat sélectionné", "missing": missing}), 400
 
         if not NOTION_TOKEN or not NOTION_DATABASE_ID:
             return jsonify({"error": "Configuration Notion manquante"}), 500
 
         notion = NotionExporter(NOTION_TOKEN, NOTION_DATABASE_ID)
-        
+
         # Ajouter le mot-clé à chaque résultat avant l'export
-        exported_count = 0
         for result in selected_results:
-            try:
-                # Ajouter le mot-clé au résultat
-                result['keyword'] = keyword
-                notion.export_business(result)
-                exported_count += 1
-            except Exception as e:
-                print(f"Erreur lors de l'export vers Notion pour {result.get('name')}: {str(e)}")
-                continue
+            result['keyword'] = keyword
+
+        with span('export_notion', count=len(selected_results)):
+            report = notion.export_many(selected_results)
+        counts = {status: sum(1 for item in report if item['status'] == status) for status in ('created', 'updated', 'skipped', 'failed')}
 
         return jsonify({
-            "success": True, 
-            "message": f"{exported_count} entreprise(s) exportée(s) vers Notion"
+            "success": True,
+            "message": f"{counts['created']} entreprise(s) exportée(s) vers Notion, {counts['updated']} mise(s) à jour",
+            **counts,
+            "report": report,
+            "missing": missing
         })
 
     except Exception as e:
-        print(f"Erreur lors de l'export Notion: {str(e)}")
+        logger.error(f"Erreur lors de l'export Notion: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/export-sheets', methods=['GET', 'POST'])
@@ -388,100 +1089,51 @@ def export_to_sheets():
             keyword = data.get('keyword', '')
             city = data.get('city', '')
             radius = data.get('radius', '5')
-            selected_results = data.get('results', [])
+            spreadsheet_id = data.get('spreadsheet_id')
+            selected_results, missing = read_export_results(data)
         else:  # GET method
             keyword = request.args.get('keyword', '')
             city = request.args.get('city', '')
             radius = request.args.get('radius', '5')
-            selected_results = request.args.get('results', [])
+            spreadsheet_id = request.args.get('spreadsheet_id')
+            selected_results, missing = read_export_results(request.args)
 
         if not selected_results:
-            return jsonify({"error": "Aucun résultat sélectionné"}), 400
+            return jsonify({"error": "Aucun résultat sélectionné", "missing": missing}), 400
 
         # Ajouter le mot-clé à chaque résultat
         for result in selected_results:
             result['keyword'] = keyword
 
-        # Exporter vers Google Sheets
-        sheet_url = export_to_gsheet(selected_results, f"Recherche {keyword} - {city}")
-        return jsonify({"success": True, "url": sheet_url})
+        # Exporter vers Google Sheets : nouveau classeur, ou ajout des seules
+        # entreprises nouvelles ou modifiées à un classeur déjà exporté
+        sheet = export_to_gsheet(selected_results, f"Recherche {keyword} - {city}", spreadsheet_id)
+        if sheet is None:
+            return jsonify({"success": False, "url": None, "missing": missing})
+        return jsonify({"success": True, **sheet, "missing": missing})
 
     except Exception as e:
-        print(f"Erreur lors de l'export Google Sheets: {str(e)}")
+        logger.error(f"Erreur lors de l'export Google Sheets: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-def export_to_gsheet(data, source):
+def export_to_gsheet(data, source, spreadsheet_id=None):
     try:
-        creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, SCOPES)
-        client = gspread.authorize(creds)
-        
-        sheet_name = f'Prospection_{source}_{datetime.now().strftime("%d-%m-%Y")}'
-        spreadsheet = client.create(sheet_name)
-        worksheet = spreadsheet.sheet1
-        
-        # Renommer la première feuille
-        worksheet.update_title('Liste Prospects')
-        
-        # Définir les en-têtes
-        headers = [
-            'ID',
-            'Nom Entreprise',
-            'Adresse Complète',
-            'Téléphone',
-            'Site Web',
-            'Type d\'établissement',
-            'Note Google',
-            'Nombre d\'avis',
-            'Horaires d\'ouverture',
-            'Email (à compléter)',
-            'Statut Contact',
-            'Notes/Commentaires'
-        ]
-        
-        worksheet.append_row(headers)
-        
-        # Formater les en-têtes
-        worksheet.format('A1:L1', {
-            "backgroundColor": {"red": 0.2, "green": 0.2, "blue": 0.2},
-            "textFormat": {"foregroundColor": {"red": 1, "green": 1, "blue": 1}, "bold": True},
-            "horizontalAlignment": "CENTER"
-        })
-        
-        # Ajouter les données
-        for item in data:
-            row = [str(value) for value in item.values()]
-            worksheet.append_row(row)
-        
-        # Formater le contenu
-        if len(data) > 0:
-            worksheet.format(f'A2:L{len(data)+1}', {
-                "backgroundColor": {"red": 1, "green": 1, "blue": 1},
-                "textFormat": {"foregroundColor": {"red": 0, "green": 0, "blue": 0}},
-                "verticalAlignment": "MIDDLE",
-                "wrapStrategy": "WRAP"
-            })
-        
-        # Ajustements finaux
-        worksheet.freeze(rows=1)
-        worksheet.set_basic_filter()
-        worksheet.columns_auto_resize(0, len(headers)-1)
-        
-        # Partager le spreadsheet
-        spreadsheet.share(None, perm_type='anyone', role='reader')
-        
-        return spreadsheet.url
-        
+        with span('export_sheets', count=len(data)):
+            if spreadsheet_id:
+                return append_prospects_sheet(get_gspread_client(), spreadsheet_id, data)
+            return write_prospects_sheet(get_gspread_client(), data, source)
+
     except Exception as e:
-        print(f"Erreur lors de l'export: {str(e)}")
+        logger.error(f"Erreur lors de l'export: {str(e)}")
         return None
 
 @app.route('/api/test-notion', methods=['GET', 'POST'])
 def test_notion():
     try:
-        print(f"Test de connexion Notion avec token: {NOTION_TOKEN[:10]}...")
-        print(f"Test avec database ID: {NOTION_DATABASE_ID}")
+        logger.info(f"Test de connexion Notion avec token: {NOTION_TOKEN[:10]}...")
+        logger.info(f"Test avec database ID: {NOTION_DATABASE_ID}")
         
-        notion = Client(auth=NOTION_TOKEN)
+        notion = get_notion_client(NOTION_TOKEN)
         database = notion.databases.retrieve(database_id=NOTION_DATABASE_ID)
         
         return jsonify({
@@ -493,7 +1145,7 @@ def test_notion():
             }
         })
     except Exception as e:
-        print(f"Erreur lors du test Notion: {str(e)}")
+        logger.error(f"Erreur lors du test Notion: {str(e)}")
         return jsonify({
             "success": False,
             "error": str(e)
@@ -506,12 +1158,78 @@ def search():
         keyword = data.get('keyword', '')
         city = data.get('city', '')
         radius = data.get('radius', 1000)
+        mode = data.get('mode', 'nearby')
     else:  # GET method
         keyword = request.args.get('keyword', '')
         city = request.args.get('city', '')
         radius = int(request.args.get('radius', 1000))
+        mode = request.args.get('mode', 'nearby')
     
-    return perform_search(keyword, city, radius)
+    try:
+        ranking = ranking_params()
+        projection = projection_params()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    start_search_budget(mode)
+    return jsonify(shape_results(perform_search(keyword, city, radius, mode, details_fields(SEARCH_DETAILS_FIELDS), ranking),
+                                 projection))
+
+@app.route('/search/stream', methods=['GET', 'POST'])
+def search_stream():
+    if request.method == 'POST':
+        data = request.get_json()
+        keyword = data.get('keyword', '')
+        city = data.get('city', '')
+        radius = data.get('radius', 1000)
+        mode = data.get('mode', 'nearby')
+    else:  # GET method
+        keyword = request.args.get('keyword', '')
+        city = request.args.get('city', '')
+        radius = int(request.args.get('radius', 1000))
+        mode = request.args.get('mode', 'nearby')
+
+    try:
+        ranking = ranking_params()
+        projection = projection_params()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    start_search_budget(mode)
+    geocode_started = time.monotonic()
+    city, location_coords = parse_city_coords(city)
+    if not location_coords:
+        try:
+            location_coords = geocode_city(get_gmaps(), city)
+        except Exception as e:
+            logger.error(f"Erreur lors du géocodage: {str(e)}")
+        if not location_coords:
+            return jsonify({"error": f"Localisation '{city}' non trouvée"}), 400
+    timings = {'geocode_ms': round((time.monotonic() - geocode_started) * 1000)}
+
+    return stream_search_response(keyword, location_coords, int(radius) * 1000, details_fields(SEARCH_DETAILS_FIELDS), mode, timings, ranking, projection)
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    # Vérification explicite des dépendances (remplace le géocodage de test au démarrage).
+    # ?deep=1 fait un vrai appel Google Maps.
+    checks = {
+        "google_maps": bool(GOOGLE_MAPS_API_KEY),
+        "notion": bool(NOTION_TOKEN and NOTION_DATABASE_ID),
+        "google_sheets": os.path.exists(CREDENTIALS_FILE)
+    }
+    if request.args.get('deep') in ('1', 'true'):
+        try:
+            get_gmaps().geocode("Paris")  # Test simple
+        except Exception as e:
+            logger.error(f"❌ Erreur Google Maps: {str(e)}")
+            checks["google_maps"] = False
+
+    return jsonify({
+        "status": "ok" if checks["google_maps"] else "degraded",
+        "checks": checks,
+        "circuit_breakers": upstream.breaker_states()
+    }), 200 if checks["google_maps"] else 503
 
 # Route par défaut qui renvoie un message d'API
 @app.route('/')
@@ -0,0 +1,83 @@
+# Mesure du démarrage à froid : pour chaque route, un processus Python neuf
+# importe app.py puis sert une première requête via le client de test Flask.
+#
+#   python benchmarks/cold_start.py
+#   python benchmarks/cold_start.py --repeat 10 --routes / /suggestions
+#
+# Les routes par défaut ne font aucun appel réseau.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_ROUTES = ['/', '/suggestions', '/api/health', '/api/communes?q=lie', '/api/cache-stats']
+
+HEAVY_MODULES = ['googlemaps', 'notion_client', 'httpx', 'gspread', 'google.auth', 'numpy', 'pandas']
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get(sys.argv[1])
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'status': response.status_code,
+    'modules': len(sys.modules),
+    'heavy': [m for m in %r if m in sys.modules]
+}))
+""" % (HEAVY_MODULES,)
+
+
+def probe(route):
+    env = dict(os.environ)
+    env.setdefault('GOOGLE_MAPS_API_KEY', 'cold-start-benchmark')
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', _PROBE, route],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latence de démarrage à froid par route")
+    parser.add_argument('--routes', nargs='+', default=DEFAULT_ROUTES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help="sortie JSON au lieu du tableau")
+    args = parser.parse_args()
+
+    report = []
+    for route in args.routes:
+        runs = [probe(route) for _ in range(args.repeat)]
+        report.append({
+            'route': route,
+            'status': runs[-1]['status'],
+            'import_ms': round(statistics.median(r['import_ms'] for r in runs), 1),
+            'first_request_ms': round(statistics.median(r['first_request_ms'] for r in runs), 1),
+            'process_ms': round(statistics.median(r['process_ms'] for r in runs), 1),
+            'modules': runs[-1]['modules'],
+            'heavy': runs[-1]['heavy']
+        })
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'route':<28}{'status':>7}{'import':>10}{'1st req':>10}{'process':>10}{'modules':>9}  heavy imports")
+    for row in report:
+        print(f"{row['route']:<28}{row['status']:>7}{row['import_ms']:>9.1f}ms{row['first_request_ms']:>8.1f}ms"
+              f"{row['process_ms']:>8.1f}ms{row['modules']:>9}  {', '.join(row['heavy']) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
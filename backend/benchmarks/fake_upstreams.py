@@ -0,0 +1,341 @@
+# Serveur HTTP local imitant les API Google Maps (Geocoding, Nearby Search,
+# Place Details), Notion et Google Sheets/Drive, pour mesurer le backend
+# sans consommer de quota. Latence, taux d'erreur et nombre de résultats
+# sont configurables ; les appels reçus sont comptés par opération.
+#
+#   python benchmarks/fake_upstreams.py --port 8765 --latency-ms 80 --error-rate 0.01
+#
+# Puis lancer app.py avec :
+#   GOOGLE_MAPS_BASE_URL=http://127.0.0.1:8765 NOTION_BASE_URL=http://127.0.0.1:8765
+#   GOOGLE_API_BASE_URL=http://127.0.0.1:8765 GOOGLE_CREDENTIALS_FILE=<fichier écrit par --credentials>
+#
+# GET /_stats renvoie les compteurs d'appels, POST /_reset les remet à zéro.
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+PAGE_SIZE = 20
+
+
+class FakeUpstreamConfig:
+    def __init__(self, latency_ms=50, jitter_ms=20, error_rate=0.0, results=60, notion_pages=500, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.results = results
+        self.notion_pages = notion_pages
+        self.random = random.Random(seed)
+
+
+def _place_id(keyword, lat, lng, index):
+    digest = hashlib.sha1(f'{keyword}|{lat:.4f}|{lng:.4f}|{index}'.encode()).hexdigest()[:16]
+    return f'fake_{digest}'
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, FakeUpstreamHandler)
+        self.config = config
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.sheets = {}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, operation, outcome):
+        with self.lock:
+            key = f'{operation}:{outcome}'
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.calls)
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+
+    def notion_page(self, index):
+        return {
+            'object': 'page',
+            'id': f'00000000-0000-0000-0000-{index:012d}',
+            'url': f'https://www.notion.so/fake-{index}',
+            'last_edited_time': '2024-01-01T00:00:00.000Z',
+            'properties': {'Name': {'type': 'title', 'title': [{'plain_text': f'Entreprise existante {index}'}]}}
+        }
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # (méthode, motif du chemin, opération)
+    ROUTES = [
+        ('GET', r'^/maps/api/geocode/json$', 'maps.geocode'),
+        ('GET', r'^/maps/api/place/nearbysearch/json$', 'maps.places_nearby'),
+        ('GET', r'^/maps/api/place/details/json$', 'maps.place'),
+        ('POST', r'^/v1/databases/[^/]+/query$', 'notion.databases.query'),
+        ('GET', r'^/v1/databases/[^/]+$', 'notion.databases.retrieve'),
+        ('POST', r'^/v1/pages$', 'notion.pages.create'),
+        ('PATCH', r'^/v1/pages/[^/]+$', 'notion.pages.update'),
+        ('POST', r'^/token$', 'google.token'),
+        ('GET', r'^/v1/.+/allowedLocations$', 'google.allowed_locations'),
+        ('POST', r'^/drive/v3/files$', 'drive.create'),
+        ('POST', r'^/drive/v3/files/[^/]+/permissions$', 'drive.permissions'),
+        ('GET', r'^/v4/spreadsheets/[^/:]+$', 'sheets.get'),
+        ('POST', r'^/v4/spreadsheets/[^/:]+:batchUpdate$', 'sheets.batch_update'),
+        ('PUT', r'^/v4/spreadsheets/[^/:]+/values/.+$', 'sheets.values.update'),
+        ('POST', r'^/v4/spreadsheets/[^/:]+/values:batchUpdate$', 'sheets.values.batch_update'),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        raw = self.rfile.read(length)
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return parse_qs(raw.decode())
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = self._read_json() if method in ('POST', 'PUT', 'PATCH') else {}
+
+        if url.path == '/_stats':
+            return self._send_json(200, self.server.stats())
+        if url.path == '/_reset':
+            self.server.reset()
+            return self._send_json(200, {})
+
+        for route_method, pattern, operation in self.ROUTES:
+            if route_method == method and re.match(pattern, url.path):
+                break
+        else:
+            return self._send_json(404, {'error': f'{method} {url.path} non simulé'})
+
+        config = self.server.config
+        delay = max(0.0, config.latency_ms + config.random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+        time.sleep(delay)
+
+        # L'authentification Google n'est pas concernée par les erreurs simulées
+        if not operation.startswith('google.') and config.random.random() < config.error_rate:
+            self.server.count(operation, 'error')
+            if operation.startswith('maps.'):
+                return self._send_json(200, {'status': 'UNKNOWN_ERROR', 'results': []})
+            return self._send_json(503, {'object': 'error', 'status': 503, 'code': 'service_unavailable',
+                                         'message': 'Erreur simulée'})
+
+        self.server.count(operation, 'ok')
+        handler = getattr(self, 'handle_' + operation.replace('.', '_'))
+        return self._send_json(200, handler(url.path, query, body))
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_PATCH(self):
+        self._dispatch('PATCH')
+
+    # --- Google Maps -----------------------------------------------------
+
+    def handle_maps_geocode(self, path, query, body):
+        seed = int(hashlib.sha1(query.get('address', '').encode()).hexdigest()[:8], 16)
+        location = {'lat': 50.0 + (seed % 1000) / 1000, 'lng': 4.0 + (seed // 1000 % 1000) / 1000}
+        return {'status': 'OK', 'results': [{'geometry': {'location': location}}]}
+
+    def handle_maps_places_nearby(self, path, query, body):
+        if 'pagetoken' in query:
+            keyword, lat, lng, page = json.loads(query['pagetoken'])
+        else:
+            lat, lng = map(float, query['location'].split(','))
+            keyword, page = query.get('keyword', ''), 0
+        total = min(self.server.config.results, 60)
+        start = page * PAGE_SIZE
+        results = []
+        for index in range(start, min(start + PAGE_SIZE, total)):
+            results.append({
+                'place_id': _place_id(keyword, lat, lng, index),
+                'name': f'{keyword} {index}',
+                'vicinity': f'{index} Rue de Test',
+                'rating': round(3 + (index % 20) / 10, 1),
+                'user_ratings_total': index * 7,
+                'business_status': 'OPERATIONAL',
+                'geometry': {'location': {'lat': lat + (index % 10 - 5) * 0.001, 'lng': lng + (index // 10 - 3) * 0.001}}
+            })
+        response = {'status': 'OK' if results else 'ZERO_RESULTS', 'results': results}
+        if start + PAGE_SIZE < total:
+            response['next_page_token'] = json.dumps([keyword, lat, lng, page + 1])
+        return response
+
+    def handle_maps_place(self, path, query, body):
+        place_id = query.get('place_id', '')
+        return {'status': 'OK', 'result': {
+            'place_id': place_id,
+            'name': f'Entreprise {place_id[-6:]}',
+            'formatted_address': f'{place_id[-3:]} Rue de Test, 4000 Liège, Belgique',
+            'formatted_phone_number': '04 123 45 67',
+            'website': f'https://{place_id}.example.be',
+            'rating': 4.2,
+            'user_ratings_total': 42,
+            'business_status': 'OPERATIONAL',
+            'opening_hours': {'weekday_text': ['lundi: 09:00–18:00']}
+        }}
+
+    # --- Notion ----------------------------------------------------------
+
+    def handle_notion_databases_query(self, path, query, body):
+        # Les requêtes incrémentales (filtrées) ne renvoient rien de nouveau
+        if body.get('filter'):
+            return {'object': 'list', 'results': [], 'has_more': False, 'next_cursor': None}
+        start = int(body.get('start_cursor') or 0)
+        size = int(body.get('page_size') or 100)
+        end = min(start + size, self.server.config.notion_pages)
+        has_more = end < self.server.config.notion_pages
+        return {
+            'object': 'list',
+            'results': [self.server.notion_page(i) for i in range(start, end)],
+            'has_more': has_more,
+            'next_cursor': str(end) if has_more else None
+        }
+
+    def handle_notion_databases_retrieve(self, path, query, body):
+        return {'object': 'database', 'id': path.rsplit('/', 1)[-1],
+                'title': [{'plain_text': 'Prospects (simulé)'}], 'properties': {}}
+
+    def handle_notion_pages_create(self, path, query, body):
+        page_id = str(uuid.uuid4())
+        return {'object': 'page', 'id': page_id, 'url': f'https://www.notion.so/{page_id}',
+                'properties': body.get('properties', {})}
+
+    def handle_notion_pages_update(self, path, query, body):
+        page_id = path.rsplit('/', 1)[-1]
+        return {'object': 'page', 'id': page_id, 'url': f'https://www.notion.so/{page_id}',
+                'properties': body.get('properties', {})}
+
+    # --- Google OAuth, Drive et Sheets --------------------------------------
+
+    def handle_google_token(self, path, query, body):
+        return {'access_token': uuid.uuid4().hex, 'expires_in': 3600, 'token_type': 'Bearer'}
+
+    def handle_google_allowed_locations(self, path, query, body):
+        return {'locations': [], 'encodedLocations': '0x0'}
+
+    def handle_drive_create(self, path, query, body):
+        spreadsheet_id = uuid.uuid4().hex
+        with self.server.lock:
+            self.server.sheets[spreadsheet_id] = body.get('name', '')
+        return {'id': spreadsheet_id, 'name': body.get('name', '')}
+
+    def handle_drive_permissions(self, path, query, body):
+        return {'id': 'anyoneWithLink', 'type': body.get('type'), 'role': body.get('role')}
+
+    def handle_sheets_get(self, path, query, body):
+        spreadsheet_id = path.rsplit('/', 1)[-1]
+        return {
+            'spreadsheetId': spreadsheet_id,
+            'properties': {'title': self.server.sheets.get(spreadsheet_id, '')},
+            'sheets': [{'properties': {'sheetId': 0, 'title': 'Feuille 1', 'index': 0,
+                                       'gridProperties': {'rowCount': 1000, 'columnCount': 26}}}]
+        }
+
+    def handle_sheets_batch_update(self, path, query, body):
+        spreadsheet_id = path.rsplit('/', 1)[-1].split(':')[0]
+        return {'spreadsheetId': spreadsheet_id, 'replies': [{} for _ in body.get('requests', [])]}
+
+    def handle_sheets_values_update(self, path, query, body):
+        values = body.get('values', [])
+        return {'updatedRange': body.get('range', ''), 'updatedRows': len(values),
+                'updatedCells': sum(len(row) for row in values)}
+
+    def handle_sheets_values_batch_update(self, path, query, body):
+        spreadsheet_id = path.split('/')[3]
+        data = body.get('data', [])
+        return {'spreadsheetId': spreadsheet_id, 'totalUpdatedRows': sum(len(item.get('values', [])) for item in data),
+                'responses': [{'updatedRange': item.get('range', '')} for item in data]}
+
+
+def write_fake_credentials(path, base_url):
+    # Compte de service factice : la clé est valide (signature du JWT) et
+    # le jeton est demandé au serveur simulé
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode()
+    with open(path, 'w') as f:
+        json.dump({
+            'type': 'service_account',
+            'project_id': 'benchmark',
+            'private_key_id': 'benchmark',
+            'private_key': pem,
+            'client_email': 'benchmark@benchmark.iam.gserviceaccount.com',
+            'client_id': '0',
+            'token_uri': f'{base_url}/token'
+        }, f)
+    return path
+
+
+def start_fake_upstreams(config, host='127.0.0.1', port=0):
+    # Démarre le serveur dans un thread ; port=0 choisit un port libre
+    server = FakeUpstreamServer((host, port), config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API Google Maps, Notion et Sheets simulées")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--results', type=int, default=60, help="lieux par recherche Nearby (max 60)")
+    parser.add_argument('--notion-pages', type=int, default=500, help="pages déjà présentes dans la base Notion")
+    parser.add_argument('--credentials', help="écrit un credentials.json factice à ce chemin")
+    args = parser.parse_args()
+
+    config = FakeUpstreamConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.results, args.notion_pages)
+    server = FakeUpstreamServer((args.host, args.port), config)
+    if args.credentials:
+        write_fake_credentials(args.credentials, server.base_url)
+    print(f"API simulées sur {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
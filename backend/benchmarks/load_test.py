@@ -0,0 +1,258 @@
+# Banc de charge hors-ligne : démarre les API simulées (fake_upstreams.py),
+# lance app.py dans un processus séparé pointé vers elles, puis envoie des
+# requêtes concurrentes sur les routes de recherche et d'export.
+# Rapporte débit, latences p50/p95/p99 et appels aux API par scénario et
+# niveau de concurrence.
+#
+#   python benchmarks/load_test.py
+#   python benchmarks/load_test.py --scenarios recherche export-notion --concurrency 1 8 32 --requests 200
+#   python benchmarks/load_test.py --json > baseline.json
+#   python benchmarks/load_test.py --baseline baseline.json --max-regression 0.2
+#
+# Avec --baseline, le code de sortie vaut 1 si un p95 ou un débit régresse
+# au-delà du seuil par rapport au fichier de référence.
+import argparse
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from fake_upstreams import FakeUpstreamConfig, start_fake_upstreams, write_fake_credentials
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ['recherche', 'search', 'export-csv', 'export-notion', 'export-sheets']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, p):
+    # Rang le plus proche, sur des valeurs triées
+    if not values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
+
+
+def export_rows(count, prefix):
+    return [{
+        'id': f'{prefix}_{i}',
+        'name': f'Entreprise {prefix} {i}',
+        'address': f'{i} Rue de Test, 4000 Liège',
+        'phone': '04 123 45 67',
+        'website': f'https://{prefix}-{i}.example.be',
+        'rating': 4.5,
+        'total_ratings': i,
+        'business_status': 'OPERATIONAL',
+        'opening_hours': ['lundi: 09:00–18:00']
+    } for i in range(count)]
+
+
+def build_request(scenario, index, args, run_id=''):
+    # (méthode, chemin, kwargs requests) de la requête n° index du scénario.
+    # run_id distingue les niveaux de concurrence : avec --unique, aucun
+    # niveau ne profite des caches remplis par le précédent, et les lignes
+    # exportées ne sont jamais des doublons Notion.
+    keyword = f'{args.keyword} {run_id}{index}' if args.unique else args.keyword
+    headers = {'Cache-Control': 'no-cache'} if args.unique else {}
+    if scenario == 'recherche':
+        params = {'keyword': keyword, 'city': args.city, 'radius': args.radius, 'mode': args.mode}
+        return 'GET', '/api/recherche-google', {'params': params, 'headers': headers}
+    if scenario == 'search':
+        params = {'keyword': keyword, 'city': args.city, 'radius': args.radius, 'mode': args.mode}
+        return 'GET', '/search', {'params': params, 'headers': headers}
+    rows = export_rows(args.export_rows, f'{run_id}r{index}')
+    payload = {'keyword': keyword, 'city': args.city, 'radius': args.radius, 'results': rows}
+    return 'POST', '/api/' + scenario, {'json': payload}
+
+
+class Backend:
+    # app.py dans un sous-processus (serveur Flask threadé ou gunicorn)
+
+    def __init__(self, env, server='flask', workers=2, log_path=os.devnull):
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        if server == 'gunicorn':
+            command = [sys.executable, '-m', 'gunicorn', '-b', f'127.0.0.1:{self.port}', '-w', str(workers),
+                       '-k', 'gthread', '--threads', '16', 'app:app']
+        else:
+            command = [sys.executable, '-c',
+                       f"import app; app.app.run(host='127.0.0.1', port={self.port}, threaded=True)"]
+        self.log = open(log_path, 'w')
+        self.process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"app.py s'est arrêté (code {self.process.returncode})")
+            try:
+                requests.get(self.url + '/', timeout=1)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise RuntimeError("app.py ne répond pas")
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+def run_level(backend_url, fake, scenario, concurrency, args):
+    local = threading.local()
+
+    def send(index):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        method, path, kwargs = build_request(scenario, index, args, f'c{concurrency}')
+        started = time.perf_counter()
+        try:
+            response = session.request(method, backend_url + path, timeout=args.timeout, **kwargs)
+            response.content  # corps complet, y compris les réponses streamées
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    # Échauffement (connexions, index Notion, imports paresseux) hors mesure
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, range(-args.warmup, 0)))
+    fake.reset()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(send, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    upstream = fake.stats()
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': sum(1 for _, ok in samples if not ok),
+        'throughput_rps': round(len(samples) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'upstream_calls': sum(upstream.values()),
+        'upstream': upstream
+    }
+
+
+def compare(results, baseline, max_regression):
+    # Régressions de p95 ou de débit par rapport à une exécution de référence
+    reference = {(r['scenario'], r['concurrency']): r for r in baseline}
+    regressions = []
+    for result in results:
+        base = reference.get((result['scenario'], result['concurrency']))
+        if not base:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + max_regression):
+            regressions.append(f"{result['scenario']} x{result['concurrency']}: p95 {base['p95_ms']} -> {result['p95_ms']} ms")
+        if result['throughput_rps'] < base['throughput_rps'] * (1 - max_regression):
+            regressions.append(f"{result['scenario']} x{result['concurrency']}: débit {base['throughput_rps']} -> {result['throughput_rps']} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de charge hors-ligne du backend")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=50, help="requêtes mesurées par scénario et niveau")
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--keyword', default='Plombier')
+    parser.add_argument('--city', default='Liège')
+    parser.add_argument('--radius', type=int, default=5)
+    parser.add_argument('--mode', default='nearby', choices=['nearby', 'tiled', 'local'])
+    parser.add_argument('--unique', action='store_true',
+                        help="un mot-clé différent par requête et Cache-Control: no-cache (caches froids)")
+    parser.add_argument('--export-rows', type=int, default=10,
+                        help="entreprises par export (Notion limite à ~3 créations/s)")
+    parser.add_argument('--latency-ms', type=float, default=50, help="latence simulée des API")
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--results', type=int, default=60, help="lieux par recherche Nearby (max 60)")
+    parser.add_argument('--notion-pages', type=int, default=500)
+    parser.add_argument('--notion-rate-limit', type=float,
+                        help="remplace NOTION_RATE_LIMIT côté backend (3 req/s par défaut, comme Notion)")
+    parser.add_argument('--server', choices=['flask', 'gunicorn'], default='flask')
+    parser.add_argument('--workers', type=int, default=2, help="workers gunicorn")
+    parser.add_argument('--log', default=os.devnull, help="fichier recevant les journaux de app.py")
+    parser.add_argument('--json', action='store_true', help="sortie JSON au lieu du tableau")
+    parser.add_argument('--baseline', help="résultats JSON d'une exécution de référence")
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    args = parser.parse_args()
+
+    config = FakeUpstreamConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.results, args.notion_pages)
+    fake = start_fake_upstreams(config)
+    workdir = tempfile.mkdtemp(prefix='api_finder_bench_')
+
+    env = dict(os.environ)
+    env.update({
+        'GOOGLE_MAPS_API_KEY': 'AIzaBenchmarkKey',
+        'GOOGLE_MAPS_BASE_URL': fake.base_url,
+        'NOTION_BASE_URL': fake.base_url,
+        'GOOGLE_API_BASE_URL': fake.base_url,
+        'GOOGLE_CREDENTIALS_FILE': write_fake_credentials(os.path.join(workdir, 'credentials.json'), fake.base_url),
+        'NOTION_TOKEN': 'secret_benchmark',
+        'NOTION_DATABASE_ID': 'benchmark-database',
+        'CACHE_DB_PATH': os.path.join(workdir, 'cache.sqlite3'),
+        'JOBS_DB_PATH': os.path.join(workdir, 'jobs.sqlite3'),
+        'LOG_LEVEL': 'WARNING',
+        # Les appels simulés ne sont pas facturés : budgets Maps sans effet
+        'QUOTA_USER_DAILY_BUDGET_USD': '1e9',
+        'QUOTA_MONTHLY_BUDGET_USD': '1e9'
+    })
+    if args.notion_rate_limit:
+        env['NOTION_RATE_LIMIT'] = str(args.notion_rate_limit)
+
+    backend = Backend(env, args.server, args.workers, args.log)
+    results = []
+    try:
+        backend.wait_ready()
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                results.append(run_level(backend.url, fake, scenario, concurrency, args))
+    finally:
+        backend.stop()
+        fake.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'scénario':<15} {'conc.':>5} {'req.':>5} {'err.':>5} {'req/s':>8} "
+              f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'appels API':>11}")
+        for r in results:
+            print(f"{r['scenario']:<15} {r['concurrency']:>5} {r['requests']:>5} {r['errors']:>5} "
+                  f"{r['throughput_rps']:>8.2f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} "
+                  f"{r['upstream_calls']:>11}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"RÉGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
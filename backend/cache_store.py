@@ -0,0 +1,241 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Fichier SQLite partagé par tous les workers gunicorn d'une même machine
+CACHE_DB_PATH = os.getenv('CACHE_DB_PATH', os.path.join(tempfile.gettempdir(), 'api_finder_cache.sqlite3'))
+# Compteurs hits/misses gardés en mémoire et reportés dans cache_stats au plus
+# toutes les CACHE_STATS_FLUSH_INTERVAL secondes (et à l'arrêt du processus)
+CACHE_STATS_FLUSH_INTERVAL = float(os.getenv('CACHE_STATS_FLUSH_INTERVAL', '10'))
+# last_access n'est réécrit que s'il date de plus de CACHE_ACCESS_UPDATE_INTERVAL
+# secondes : l'ordre LRU reste correct à cette précision près
+CACHE_ACCESS_UPDATE_INTERVAL = float(os.getenv('CACHE_ACCESS_UPDATE_INTERVAL', '60'))
+# Éviction LRU une fois toutes les CACHE_EVICT_EVERY écritures d'un processus
+# (au plus un dixième de la taille maximale, dépassement temporaire toléré)
+CACHE_EVICT_EVERY = int(os.getenv('CACHE_EVICT_EVERY', '100'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_cache_entries_access ON cache_entries (namespace, last_access);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (namespace, name)
+);
+"""
+
+
+class SQLiteCache:
+    # Cache clé/valeur JSON sur disque, avec TTL par entrée et éviction LRU.
+    # Chaque thread a sa propre connexion ; le mode WAL permet à plusieurs
+    # processus de lire et d'écrire le même fichier.
+
+    def __init__(self, namespace, ttl, max_entries, path=CACHE_DB_PATH):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self._local = threading.local()
+        self._pending = {}
+        self._writes = 0
+        self._evict_every = min(CACHE_EVICT_EVERY, max(1, max_entries // 10))
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        atexit.register(self.flush)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, n=1):
+        if not n:
+            return
+        with self._lock:
+            self._pending[name] = self._pending.get(name, 0) + n
+            due = time.monotonic() - self._flushed_at >= CACHE_STATS_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        # Reporte les compteurs en mémoire dans cache_stats (une transaction)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        try:
+            self._connect().executemany(
+                "INSERT INTO cache_stats (namespace, name, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (namespace, name) DO UPDATE SET value = value + excluded.value",
+                [(self.namespace, name, n) for name, n in pending.items()]
+            )
+        except Exception as e:
+            # Compteurs remis en attente pour le prochain report
+            with self._lock:
+                for name, n in pending.items():
+                    self._pending[name] = self._pending.get(name, 0) + n
+            logger.error(f"Erreur d'écriture des statistiques du cache {self.namespace}: {str(e)}")
+
+    def _evict_due(self, n=1):
+        with self._lock:
+            self._writes += n
+            if self._writes < self._evict_every:
+                return False
+            self._writes = 0
+            return True
+
+    def _evict(self, conn):
+        conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+            "SELECT key FROM cache_entries WHERE namespace = ? "
+            "ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_entries)
+        )
+
+    def get(self, key):
+        try:
+            conn = self._connect()
+            now = time.time()
+            row = conn.execute(
+                "SELECT value, expires_at, last_access FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+                self._count('misses')
+                record_cache(self.namespace, 'miss')
+                return None
+            if now - row[2] >= CACHE_ACCESS_UPDATE_INTERVAL:
+                conn.execute(
+                    "UPDATE cache_entries SET last_access = ? WHERE namespace = ? AND key = ?",
+                    (now, self.namespace, key)
+                )
+            self._count('hits')
+            record_cache(self.namespace, 'hit')
+            return json.loads(row[0])
+        except Exception as e:
+            logger.error(f"Erreur de lecture du cache {self.namespace}: {str(e)}")
+            return None
+
+    def set(self, key, value, ttl=None):
+        try:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), now + (ttl or self.ttl), now)
+            )
+            # Éviction LRU au-delà de la taille maximale
+            if self._evict_due():
+                self._evict(conn)
+        except Exception as e:
+            logger.error(f"Erreur d'écriture du cache {self.namespace}: {str(e)}")
+
+    def get_many(self, keys):
+        # Lecture groupée : {clé: valeur} des entrées présentes et non expirées
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        try:
+            conn = self._connect()
+            now = time.time()
+            found = {}
+            touched = []
+            # SQLite limite le nombre de paramètres d'une requête
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT key, value, last_access FROM cache_entries WHERE namespace = ? AND expires_at >= ? "
+                    f"AND key IN ({','.join('?' * len(chunk))})",
+                    (self.namespace, now, *chunk)
+                ).fetchall()
+                for key, value, last_access in rows:
+                    found[key] = json.loads(value)
+                    if now - last_access >= CACHE_ACCESS_UPDATE_INTERVAL:
+                        touched.append(key)
+            for start in range(0, len(touched), 500):
+                chunk = touched[start:start + 500]
+                conn.execute(
+                    f"UPDATE cache_entries SET last_access = ? WHERE namespace = ? "
+                    f"AND key IN ({','.join('?' * len(chunk))})",
+                    (now, self.namespace, *chunk)
+                )
+            self._count('hits', len(found))
+            self._count('misses', len(keys) - len(found))
+            record_cache(self.namespace, 'hit', len(found))
+            record_cache(self.namespace, 'miss', len(keys) - len(found))
+            return found
+        except Exception as e:
+            logger.error(f"Erreur de lecture du cache {self.namespace}: {str(e)}")
+            return {}
+
+    def set_many(self, items, ttl=None):
+        # Écriture groupée en une transaction, éviction LRU au plus une fois
+        items = list(items)
+        if not items:
+            return
+        try:
+            conn = self._connect()
+            now = time.time()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(self.namespace, key, json.dumps(value), now + (ttl or self.ttl), now) for key, value in items]
+                )
+                if self._evict_due(len(items)):
+                    self._evict(conn)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except Exception as e:
+            logger.error(f"Erreur d'écriture du cache {self.namespace}: {str(e)}")
+
+    def stats(self):
+        self.flush()
+        try:
+            conn = self._connect()
+            counters = dict(conn.execute(
+                "SELECT name, value FROM cache_stats WHERE namespace = ?", (self.namespace,)
+            ).fetchall())
+            entries = conn.execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+        except Exception as e:
+            logger.error(f"Erreur de lecture des statistiques du cache {self.namespace}: {str(e)}")
+            counters, entries = {}, 0
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            'entries': entries,
+            'max_entries': self.max_entries
+        }
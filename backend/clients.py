@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Registre des clients d'API : un client (et un pool de connexions HTTP
+# keep-alive) par service et par processus worker, créé au premier usage
+# et partagé par tous les threads. Les bibliothèques clientes
+# (googlemaps, notion_client, gspread, google-auth) sont importées à ce
+# moment-là : un démarrage à froid ne paie que ce que la route utilise.
+
+GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+
+# Configuration Google Sheets
+SCOPES = ['https://spreadsheets.google.com/feeds',
+          'https://www.googleapis.com/auth/drive']
+CREDENTIALS_FILE = os.getenv('GOOGLE_CREDENTIALS_FILE', 'credentials.json')
+
+# Adresses des API, remplaçables pour viser des serveurs de test (benchmarks/fake_upstreams.py)
+GOOGLE_MAPS_BASE_URL = os.getenv('GOOGLE_MAPS_BASE_URL', 'https://maps.googleapis.com')
+NOTION_BASE_URL = os.getenv('NOTION_BASE_URL', 'https://api.notion.com')
+GOOGLE_API_BASE_URL = os.getenv('GOOGLE_API_BASE_URL')
+
+# Connexions HTTP conservées par hôte (au moins le nombre de threads concurrents)
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '20'))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '30'))
+# Délai de réessai interne de googlemaps (secondes) : gardé sous le temps
+# d'un aller-retour réseau pour qu'un 5xx remonte aussitôt à upstream.call,
+# seul maître des réessais, du backoff et du coupe-circuit
+GOOGLE_MAPS_RETRY_TIMEOUT = float(os.getenv('GOOGLE_MAPS_RETRY_TIMEOUT', '0.01'))
+
+_clients = {}
+_lock = threading.RLock()
+_owner_pid = os.getpid()
+
+
+def _get_or_create(name, factory):
+    global _owner_pid
+    client = _clients.get(name)
+    if client is None or _owner_pid != os.getpid():
+        with _lock:
+            # Après un fork (gunicorn --preload), les sockets du parent ne sont pas réutilisées
+            if _owner_pid != os.getpid():
+                _clients.clear()
+                _owner_pid = os.getpid()
+            client = _clients.get(name)
+            if client is None:
+                client = factory()
+                _clients[name] = client
+    return client
+
+
+def _pooled_requests_session(session=None, base_url=None):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    class RedirectingAdapter(HTTPAdapter):
+        # Envoie toutes les requêtes vers base_url en conservant chemin et paramètres
+        def send(self, request, **kwargs):
+            url = urlsplit(request.url)
+            request.url = base_url.rstrip('/') + url.path + (f'?{url.query}' if url.query else '')
+            return super().send(request, **kwargs)
+
+    session = session or requests.Session()
+    adapter_class = RedirectingAdapter if base_url else HTTPAdapter
+    adapter = adapter_class(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_gmaps():
+    def create():
+        import googlemaps
+        from quota import MeteredMapsClient
+        if not GOOGLE_MAPS_API_KEY:
+            raise ValueError("La clé API Google Maps n'est pas définie")
+        client = googlemaps.Client(
+            key=GOOGLE_MAPS_API_KEY,
+            timeout=HTTP_TIMEOUT,
+            retry_timeout=GOOGLE_MAPS_RETRY_TIMEOUT,
+            retry_over_query_limit=False,
+            requests_session=_pooled_requests_session(),
+            base_url=GOOGLE_MAPS_BASE_URL
+        )
+        logger.info("✓ Client Google Maps initialisé avec succès")
+        # Les appels facturables sont imputés au budget (quota.py)
+        return MeteredMapsClient(client)
+    return _get_or_create('gmaps', create)
+
+
+def get_notion_client(token):
+    def create():
+        import httpx
+        from notion_client import Client
+        http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE)
+        )
+        return Client(auth=token, client=http_client, timeout_ms=int(HTTP_TIMEOUT * 1000), base_url=NOTION_BASE_URL)
+    return _get_or_create(f'notion:{token}', create)
+
+
+class _SheetsAuth:
+    # Identifiants du compte de service et jeton OAuth mis en cache jusqu'à
+    # son expiration ; le rafraîchissement est sérialisé entre threads.
+
+    def __init__(self):
+        from google.oauth2.service_account import Credentials
+        from google.auth.transport.requests import AuthorizedSession, Request
+        self.credentials = Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=SCOPES)
+        self._request = Request(_pooled_requests_session(base_url=GOOGLE_API_BASE_URL))
+        self.session = _pooled_requests_session(
+            AuthorizedSession(self.credentials, auth_request=self._request), GOOGLE_API_BASE_URL
+        )
+        self._lock = threading.Lock()
+
+    def ensure_token(self):
+        if self.credentials.valid:
+            return
+        with self._lock:
+            if not self.credentials.valid:
+                self.credentials.refresh(self._request)
+
+
+def get_gspread_client():
+    def create():
+        import gspread
+        auth = _SheetsAuth()
+        client = gspread.Client(auth.credentials, session=auth.session)
+        return auth, client
+
+    auth, client = _get_or_create('gspread', create)
+    auth.ensure_token()
+    return client
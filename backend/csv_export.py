@@ -0,0 +1,79 @@
+import csv
+import io
+import os
+import zlib
+from datetime import datetime
+
+# Dossier des exports archivés (recherche_YYYYmmdd_HHMMSS.csv, delta_YYYYmmdd_HHMMSS.csv)
+EXPORTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exports')
+
+# Nombre de lignes regroupées par morceau envoyé au client
+CSV_ROWS_PER_CHUNK = 200
+
+# Colonnes exportées : champ de l'entreprise -> en-tête
+CSV_COLUMNS = [
+    ('name', 'Nom'),
+    ('address', 'Adresse'),
+    ('phone', 'Téléphone'),
+    ('website', 'Site Web'),
+    ('rating', 'Note Google'),
+    ('total_ratings', 'Nombre d\'avis'),
+    ('business_status', 'Statut'),
+    ('keyword', 'Mot-clé recherché')
+]
+
+
+def iter_csv(results, keyword=None):
+    # Produit le CSV encodé (BOM utf-8-sig, puis en-têtes, puis lignes) par morceaux.
+    # Sans keyword, chaque entreprise garde le mot-clé qu'elle porte déjà.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+
+    def flush():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return chunk.encode('utf-8')
+
+    writer.writerow([header for _, header in CSV_COLUMNS])
+    yield '\ufeff'.encode('utf-8') + flush()
+
+    for count, item in enumerate(results, start=1):
+        row = dict(item, keyword=keyword) if keyword else item
+        writer.writerow(['' if row.get(key) is None else row.get(key) for key, _ in CSV_COLUMNS])
+        if count % CSV_ROWS_PER_CHUNK == 0:
+            yield flush()
+
+    remaining = flush()
+    if remaining:
+        yield remaining
+
+
+def iter_gzip(chunks):
+    # Compression gzip au fil de l'eau
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def archive_path(compressed=False, prefix='recherche'):
+    filename = f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return os.path.join(EXPORTS_DIR, filename + ('.gz' if compressed else ''))
+
+
+def iter_archived(chunks, path):
+    # Écrit chaque morceau dans le fichier d'archive en même temps qu'il est envoyé
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            yield chunk
+
+
+def iter_completed(chunks, callback):
+    # Appelle callback une fois le flux envoyé en entier (pas si le client s'interrompt)
+    yield from chunks
+    callback()
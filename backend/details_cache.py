@@ -0,0 +1,34 @@
+import os
+from cache_store import SQLiteCache
+from worker_pool import SingleFlight
+
+# Durée de validité d'une fiche Place Details en cache (secondes, 7 jours par défaut)
+PLACE_DETAILS_TTL = int(os.getenv('PLACE_DETAILS_TTL', str(7 * 24 * 3600)))
+# Nombre maximum de fiches conservées (les moins récemment lues sont évincées)
+PLACE_DETAILS_CACHE_SIZE = int(os.getenv('PLACE_DETAILS_CACHE_SIZE', '20000'))
+
+details_cache = SQLiteCache('place_details', PLACE_DETAILS_TTL, PLACE_DETAILS_CACHE_SIZE)
+# Un même lieu demandé par plusieurs requêtes simultanées n'est récupéré qu'une fois
+_details_flights = SingleFlight()
+
+
+def details_cache_key(place_id, fields):
+    # perform_search et recherche_google ne demandent pas les mêmes champs
+    return f"{place_id}|{','.join(sorted(fields))}"
+
+
+def get_place_details(gmaps, place_id, fields):
+    key = details_cache_key(place_id, fields)
+    details = details_cache.get(key)
+    if details is None:
+        def fetch():
+            # Un appel concurrent a pu terminer entre la lecture du cache et la prise du vol
+            cached = details_cache.get(key)
+            if cached is not None:
+                return cached
+            # Budget, réessais et coupe-circuit : MeteredMapsClient (quota.py)
+            result = gmaps.place(place_id, fields=fields)['result']
+            details_cache.set(key, result)
+            return result
+        details, _ = _details_flights.run(key, fetch)
+    return details
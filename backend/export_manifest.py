@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from cache_store import CACHE_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# Manifeste des exports : pour chaque destination (csv, notion:<base>,
+# sheets:<classeur>), les place_ids déjà envoyés, quand, avec quelle
+# empreinte de contenu et quelle référence côté destination (page Notion,
+# ligne du classeur). Les exports suivants n'envoient que les entreprises
+# nouvelles ou modifiées.
+EXPORT_MANIFEST_PATH = os.getenv('EXPORT_MANIFEST_PATH', CACHE_DB_PATH)
+
+# Champs dont la modification justifie un nouvel envoi
+HASHED_FIELDS = ('name', 'address', 'phone', 'website', 'rating', 'total_ratings',
+                 'business_status', 'opening_hours', 'keyword')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS export_manifest (
+    destination TEXT NOT NULL,
+    place_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    ref TEXT,
+    data TEXT NOT NULL,
+    exported_at REAL NOT NULL,
+    PRIMARY KEY (destination, place_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_export_manifest_exported_at ON export_manifest (exported_at);
+"""
+
+
+def content_hash(entreprise):
+    values = [entreprise.get(field) for field in HASHED_FIELDS]
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def parse_since(value):
+    # since= : date ISO (2024-05-01, 2024-05-01T08:00:00) ou timestamp Unix ;
+    # ValueError si le format est inconnu
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        raise ValueError("since doit être une date ISO (AAAA-MM-JJ[THH:MM:SS]) ou un timestamp")
+
+
+class ExportManifest:
+    # Même modèle que SQLiteCache : une connexion par thread, mode WAL
+
+    def __init__(self, path=EXPORT_MANIFEST_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, destination, place_ids):
+        # {place_id: {"hash", "ref", "exported_at"}} des place_ids déjà envoyés à destination
+        place_ids = [str(place_id) for place_id in place_ids if place_id]
+        found = {}
+        try:
+            conn = self._connect()
+            for start in range(0, len(place_ids), 500):
+                chunk = place_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for place_id, digest, ref, exported_at in conn.execute(
+                    f"SELECT place_id, content_hash, ref, exported_at FROM export_manifest "
+                    f"WHERE destination = ? AND place_id IN ({placeholders})",
+                    (destination, *chunk)
+                ):
+                    found[place_id] = {'hash': digest, 'ref': ref, 'exported_at': exported_at}
+        except Exception as e:
+            logger.error(f"Erreur de lecture du manifeste d'export: {str(e)}")
+        return found
+
+    def changes(self, destination, entreprises):
+        # Répartit les entreprises en (nouvelles, modifiées, inchangées).
+        # Les modifiées sont des couples (entreprise, référence du précédent envoi).
+        known = self.lookup(destination, (entreprise.get('id') for entreprise in entreprises))
+        new, changed, unchanged = [], [], []
+        for entreprise in entreprises:
+            entry = known.get(str(entreprise.get('id')))
+            if entry is None:
+                new.append(entreprise)
+            elif entry['hash'] != content_hash(entreprise):
+                changed.append((entreprise, entry['ref']))
+            else:
+                unchanged.append((entreprise, entry['ref']))
+        return new, changed, unchanged
+
+    def record(self, destination, entries):
+        # entries : couples (entreprise, référence côté destination ou None)
+        rows = [(entreprise, ref) for entreprise, ref in entries if entreprise and entreprise.get('id')]
+        if not rows:
+            return
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO export_manifest (destination, place_id, content_hash, ref, data, exported_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(destination, str(entreprise['id']), content_hash(entreprise), None if ref is None else str(ref),
+                      json.dumps({k: v for k, v in entreprise.items() if k not in ('alreadyExported', 'degraded')},
+                                 ensure_ascii=False), now)
+                     for entreprise, ref in rows]
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except Exception as e:
+            logger.error(f"Erreur d'écriture dans le manifeste d'export: {str(e)}")
+
+    def since(self, timestamp, destination=None):
+        # Entreprises exportées ou modifiées depuis timestamp, version la plus
+        # récente par place_id, dans l'ordre des envois
+        query = "SELECT place_id, data, exported_at FROM export_manifest WHERE exported_at >= ?"
+        params = [timestamp]
+        if destination:
+            query += " AND destination = ?"
+            params.append(destination)
+        try:
+            rows = self._connect().execute(query + " ORDER BY exported_at", params).fetchall()
+        except Exception as e:
+            logger.error(f"Erreur de lecture du manifeste d'export: {str(e)}")
+            return []
+        latest = {}
+        for place_id, data, _ in rows:
+            latest.pop(place_id, None)
+            latest[place_id] = json.loads(data)
+        return list(latest.values())
+
+    def stats(self):
+        try:
+            return {destination: count for destination, count in self._connect().execute(
+                "SELECT destination, COUNT(*) FROM export_manifest GROUP BY destination"
+            )}
+        except Exception as e:
+            logger.error(f"Erreur de lecture des statistiques du manifeste d'export: {str(e)}")
+            return {}
+
+
+export_manifest = ExportManifest()
@@ -0,0 +1,98 @@
+import csv
+import os
+import re
+from bisect import bisect_left
+from cache_store import SQLiteCache
+from text_utils import normalize_text
+
+# Communes belges et codes postaux embarqués avec l'application
+COMMUNES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'be_communes.csv')
+
+# Résultats Google Geocoding conservés 30 jours par défaut
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', str(30 * 24 * 3600)))
+GEOCODE_CACHE_SIZE = int(os.getenv('GEOCODE_CACHE_SIZE', '5000'))
+
+geocode_cache = SQLiteCache('geocode', GEOCODE_CACHE_TTL, GEOCODE_CACHE_SIZE)
+
+_COUNTRY_SUFFIX = re.compile(r'\s*,?\s*(belgium|belgique|belgie|belgien)$')
+_POSTCODE = re.compile(r'^\d{4}$')
+
+
+class Gazetteer:
+    # Recherche hors-ligne des communes par nom (insensible aux accents),
+    # alias (FR/NL/EN) ou code postal ; suggestions par préfixe de nom.
+
+    def __init__(self, path=COMMUNES_FILE):
+        self.communes = []
+        self._by_name = {}
+        self._by_postcode = {}
+        with open(path, encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                commune = {
+                    'name': row['name'],
+                    'postcode': row['postcode'],
+                    'province': row['province'],
+                    'lat': float(row['lat']),
+                    'lng': float(row['lng'])
+                }
+                self.communes.append(commune)
+                self._by_postcode[commune['postcode']] = commune
+                names = [row['name']] + [alias for alias in row['aliases'].split('|') if alias]
+                for name in names:
+                    self._by_name.setdefault(normalize_text(name), commune)
+        self._keys = sorted(self._by_name)
+
+    def _clean(self, query):
+        return _COUNTRY_SUFFIX.sub('', normalize_text(query)).strip()
+
+    def suggest(self, prefix, limit=10):
+        # Communes dont un nom commence par le préfixe, dans l'ordre alphabétique
+        prefix = self._clean(prefix)
+        if not prefix:
+            return []
+        if _POSTCODE.match(prefix):
+            commune = self._by_postcode.get(prefix)
+            return [commune] if commune else []
+        results = []
+        start = bisect_left(self._keys, prefix)
+        for key in self._keys[start:]:
+            if not key.startswith(prefix) or len(results) >= limit:
+                break
+            commune = self._by_name[key]
+            if commune not in results:
+                results.append(commune)
+        return results
+
+    def lookup(self, query):
+        # Nom exact, alias ou code postal uniquement : le fichier ne contient
+        # pas toutes les communes, un préfixe (« Herent » → Herentals) peut
+        # désigner une autre ville. Les préfixes restent réservés à suggest.
+        key = self._clean(query)
+        if not key:
+            return None
+        if _POSTCODE.match(key):
+            return self._by_postcode.get(key)
+        return self._by_name.get(key)
+
+
+gazetteer = Gazetteer()
+
+
+def geocode_city(gmaps, city, country=None):
+    # Résout une ville en coordonnées : gazetteer local, puis cache, puis Google
+    commune = gazetteer.lookup(city)
+    if commune:
+        return {'lat': commune['lat'], 'lng': commune['lng']}
+
+    query = f"{city}, {country}" if country else city
+    key = normalize_text(query)
+    location = geocode_cache.get(key)
+    if location is not None:
+        return location
+
+    geocode_result = gmaps.geocode(query)
+    if not geocode_result:
+        return None
+    location = geocode_result[0]['geometry']['location']
+    geocode_cache.set(key, location)
+    return location
@@ -0,0 +1,38 @@
+import math
+
+EARTH_RADIUS_M = 6371000
+METERS_PER_DEGREE = 111320
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    # Distance orthodromique en mètres
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def offset(location, dx_m, dy_m):
+    # Point décalé de dx_m vers l'est et dy_m vers le nord (approximation locale)
+    lat = location['lat'] + dy_m / METERS_PER_DEGREE
+    lng = location['lng'] + dx_m / (METERS_PER_DEGREE * math.cos(math.radians(location['lat'])))
+    return {'lat': lat, 'lng': lng}
+
+
+def hex_cells(center, radius_m, cell_radius_m):
+    # Centres d'une grille hexagonale couvrant le cercle (center, radius_m).
+    # Un cercle de rayon cell_radius_m autour de chaque centre couvre tout
+    # l'hexagone, donc les cellules voisines se chevauchent.
+    step_x = math.sqrt(3) * cell_radius_m
+    step_y = 1.5 * cell_radius_m
+    rows = int(math.ceil((radius_m + cell_radius_m) / step_y)) + 1
+    cols = int(math.ceil((radius_m + cell_radius_m) / step_x)) + 1
+    cells = []
+    for row in range(-rows, rows + 1):
+        for col in range(-cols, cols + 1):
+            dx = step_x * (col + (row % 2) / 2)
+            dy = step_y * row
+            if math.hypot(dx, dy) <= radius_m + cell_radius_m:
+                cells.append(offset(center, dx, dy))
+    return cells
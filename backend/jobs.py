@@ -0,0 +1,246 @@
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from worker_pool import bounded_map
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB_PATH = os.getenv('JOBS_DB_PATH', os.path.join(tempfile.gettempdir(), 'api_finder_jobs.sqlite3'))
+# Nombre de recherches exécutées en parallèle par processus
+JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', '2'))
+# Un job "running" sans battement de cœur depuis ce délai est repris par un autre worker
+JOB_STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', '60'))
+# Battement de cœur envoyé par un thread dédié pendant toute l'exécution,
+# y compris une recherche Nearby par tuiles qui dure plusieurs minutes
+JOB_HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', str(JOB_STALE_AFTER / 4)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    nearby_done INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    heartbeat REAL
+);
+CREATE TABLE IF NOT EXISTS job_places (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    place_id TEXT NOT NULL,
+    place TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    result TEXT,
+    PRIMARY KEY (job_id, position)
+);
+"""
+
+
+class JobStore:
+    # Persistance des jobs et des lieux déjà enrichis (SQLite, mode WAL)
+
+    def __init__(self, path=JOBS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def create(self, params):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, status, params, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+            (job_id, json.dumps(params), now, now)
+        )
+        return job_id
+
+    def get(self, job_id):
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def claim(self, job_id):
+        # Prend le job si personne ne s'en occupe (ou si son worker a disparu)
+        now = time.time()
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'running', heartbeat = ?, updated_at = ? "
+            "WHERE id = ? AND (status = 'queued' OR (status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)))",
+            (now, now, job_id, now - JOB_STALE_AFTER)
+        )
+        return cursor.rowcount == 1
+
+    def resumable(self):
+        rows = self._connect().execute(
+            "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)) "
+            "ORDER BY created_at",
+            (time.time() - JOB_STALE_AFTER,)
+        ).fetchall()
+        return [row['id'] for row in rows]
+
+    def set_status(self, job_id, status, error=None):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+            (status, error, time.time(), job_id)
+        )
+
+    def heartbeat(self, job_id):
+        now = time.time()
+        self._connect().execute("UPDATE jobs SET heartbeat = ?, updated_at = ? WHERE id = ?", (now, now, job_id))
+
+    def save_places(self, job_id, places):
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            conn.execute("DELETE FROM job_places WHERE job_id = ?", (job_id,))
+            conn.executemany(
+                "INSERT INTO job_places (job_id, position, place_id, place) VALUES (?, ?, ?, ?)",
+                [(job_id, position, place['place_id'], json.dumps(place)) for position, place in enumerate(places)]
+            )
+            conn.execute("UPDATE jobs SET nearby_done = 1, updated_at = ? WHERE id = ?", (time.time(), job_id))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def pending_places(self, job_id):
+        # Lieux jamais enrichis, ou servis dégradés (quota, coupe-circuit, délai) à réessayer
+        rows = self._connect().execute(
+            "SELECT position, place FROM job_places WHERE job_id = ? AND status IN ('pending', 'degraded') "
+            "ORDER BY position",
+            (job_id,)
+        ).fetchall()
+        return [(row['position'], json.loads(row['place'])) for row in rows]
+
+    def save_result(self, job_id, position, result):
+        if not result:
+            status = 'failed'
+        elif result.get('degraded'):
+            status = 'degraded'
+        else:
+            status = 'done'
+        self._connect().execute(
+            "UPDATE job_places SET status = ?, result = ? WHERE job_id = ? AND position = ?",
+            (status, json.dumps(result) if result else None, job_id, position)
+        )
+
+    def progress(self, job_id):
+        rows = self._connect().execute(
+            "SELECT status, COUNT(*) AS n FROM job_places WHERE job_id = ? GROUP BY status", (job_id,)
+        ).fetchall()
+        counts = {row['status']: row['n'] for row in rows}
+        return {
+            'found': sum(counts.values()),
+            'done': counts.get('done', 0),
+            'degraded': counts.get('degraded', 0),
+            'failed': counts.get('failed', 0),
+            'pending': counts.get('pending', 0)
+        }
+
+    def results(self, job_id):
+        rows = self._connect().execute(
+            "SELECT result FROM job_places WHERE job_id = ? AND status IN ('done', 'degraded') ORDER BY position",
+            (job_id,)
+        ).fetchall()
+        return [json.loads(row['result']) for row in rows]
+
+
+class JobManager:
+    # Exécute les recherches en arrière-plan. `find_places(params)` renvoie
+    # les résultats Nearby Search, `enrich(place, params)` l'entreprise
+    # enrichie (ou None). Les détails déjà récupérés sont conservés en base,
+    # donc un job interrompu reprend là où il s'était arrêté ; les lieux
+    # dégradés sont réessayés à la reprise. `prepare(params)` installe le
+    # contexte du job (budget de l'utilisateur, index Notion) avant son exécution.
+
+    def __init__(self, find_places, enrich, store=None, workers=JOBS_WORKERS, concurrency=None, prepare=None):
+        self.find_places = find_places
+        self.enrich = enrich
+        self.prepare = prepare
+        self.store = store or JobStore()
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        # Relance les jobs interrompus par un redémarrage (une seule fois par processus)
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for job_id in self.store.resumable():
+            logger.info(f"Reprise du job {job_id}")
+            self._submit(job_id)
+
+    def submit(self, params):
+        self.start()
+        job_id = self.store.create(params)
+        self._submit(job_id)
+        return job_id
+
+    def _submit(self, job_id):
+        # Contexte vierge par job : le budget installé par prepare ne passe
+        # pas d'un job à l'autre sur un même thread du pool
+        self._executor.submit(contextvars.Context().run, self._run, job_id)
+
+    def status(self, job_id):
+        self.start()
+        job = self.store.get(job_id)
+        if not job:
+            return None
+        return {
+            'id': job['id'],
+            'status': job['status'],
+            'params': json.loads(job['params']),
+            'progress': self.store.progress(job_id),
+            'error': job['error'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at']
+        }
+
+    def _beat(self, job_id, stop):
+        while not stop.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                self.store.heartbeat(job_id)
+            except Exception as e:
+                logger.error(f"Erreur lors du battement de cœur du job {job_id}: {str(e)}")
+
+    def _run(self, job_id):
+        if not self.store.claim(job_id):
+            return
+        job = self.store.get(job_id)
+        params = json.loads(job['params'])
+        stop = threading.Event()
+        threading.Thread(target=self._beat, args=(job_id, stop), daemon=True).start()
+        try:
+            if self.prepare:
+                self.prepare(params)
+            if not job['nearby_done']:
+                self.store.save_places(job_id, self.find_places(params))
+
+            def enrich_and_save(item):
+                position, place = item
+                self.store.save_result(job_id, position, self.enrich(place, params))
+
+            bounded_map(enrich_and_save, self.store.pending_places(job_id), max_workers=self.concurrency)
+            self.store.set_status(job_id, 'completed')
+        except Exception as e:
+            logger.error(f"Erreur lors de l'exécution du job {job_id}: {str(e)}")
+            self.store.set_status(job_id, 'failed', str(e))
+        finally:
+            stop.set()
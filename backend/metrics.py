@@ -0,0 +1,182 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Instrumentation : compteurs et histogrammes en mémoire (un registre par
+# processus worker), exposés au format Prometheus sur /metrics, et
+# journaux JSON d'une ligne par événement sur la sortie standard.
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# Bornes des histogrammes de latence (secondes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Identifiant de la requête HTTP en cours, repris dans chaque ligne de journal
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        request_id = request_id_var.get()
+        if request_id:
+            entry['request_id'] = request_id
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level=LOG_LEVEL):
+    root = logging.getLogger()
+    if any(isinstance(handler.formatter, JSONFormatter) for handler in root.handlers):
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter())
+    root.handlers = [handler]
+    root.setLevel(level)
+
+
+def log_fields(**fields):
+    # À passer en `extra=` : champs ajoutés tels quels à la ligne JSON
+    return {'fields': fields}
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, series['buckets']):
+                    labels = _format_labels(self.labelnames, key, [('le', bound)])
+                    lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels(self.labelnames, key, [('le', '+Inf')])
+                lines.append(f'{self.name}_bucket{labels} {series["count"]}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {series["sum"]:.6f}')
+                lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {series["count"]}')
+        return lines
+
+
+http_requests = Counter('api_finder_http_requests_total', 'Requêtes HTTP traitées', ('route', 'method', 'status'))
+http_duration = Histogram('api_finder_http_request_duration_seconds', 'Durée des requêtes HTTP', ('route',))
+stage_calls = Counter('api_finder_stage_total', 'Étapes du pipeline exécutées', ('stage', 'outcome'))
+stage_duration = Histogram('api_finder_stage_duration_seconds', 'Durée des étapes du pipeline', ('stage',))
+upstream_calls = Counter('api_finder_upstream_requests_total', 'Appels aux API externes', ('service', 'operation', 'outcome'))
+upstream_duration = Histogram('api_finder_upstream_request_duration_seconds', 'Latence des API externes', ('service', 'operation'))
+cache_requests = Counter('api_finder_cache_requests_total', 'Lectures de cache', ('cache', 'result'))
+
+REGISTRY = [http_requests, http_duration, stage_calls, stage_duration, upstream_calls, upstream_duration, cache_requests]
+
+_logger = logging.getLogger('metrics')
+
+
+@contextmanager
+def span(stage, **fields):
+    # Chronomètre une étape du pipeline (géocodage, recherche, export...)
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except Exception:
+        outcome = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_calls.inc(stage=stage, outcome=outcome)
+        stage_duration.observe(elapsed, stage=stage)
+        _logger.info('span', extra=log_fields(stage=stage, outcome=outcome, duration_ms=round(elapsed * 1000, 1), **fields))
+
+
+@contextmanager
+def upstream_call(service, operation):
+    # Chronomètre un appel à une API externe (un essai = un appel)
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except Exception:
+        outcome = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        upstream_calls.inc(service=service, operation=operation, outcome=outcome)
+        upstream_duration.observe(elapsed, service=service, operation=operation)
+        _logger.debug('upstream', extra=log_fields(service=service, operation=operation, outcome=outcome,
+                                                   duration_ms=round(elapsed * 1000, 1)))
+
+
+def record_cache(cache, result, count=1):
+    if count:
+        cache_requests.inc(count, cache=cache, result=result)
+
+
+def render_prometheus():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
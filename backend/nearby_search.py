@@ -0,0 +1,225 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from geo import haversine_m, hex_cells
+from quota import QuotaExceeded
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Délai avant la première utilisation d'un next_page_token (secondes)
+PAGE_TOKEN_INITIAL_DELAY = float(os.getenv('PAGE_TOKEN_INITIAL_DELAY', '1.0'))
+# Pas de l'attente progressive quand le token n'est pas encore valide
+PAGE_TOKEN_RETRY_DELAY = float(os.getenv('PAGE_TOKEN_RETRY_DELAY', '0.5'))
+PAGE_TOKEN_MAX_ATTEMPTS = int(os.getenv('PAGE_TOKEN_MAX_ATTEMPTS', '6'))
+
+# Google plafonne Nearby Search à 3 pages de 20 résultats
+MAX_NEARBY_PAGES = 3
+NEARBY_RESULTS_CAP = 60
+
+# Recherche par tuiles : débit, parallélisme et budget d'appels par recherche
+TILED_SEARCH_QPS = float(os.getenv('TILED_SEARCH_QPS', '10'))
+TILED_SEARCH_CONCURRENCY = int(os.getenv('TILED_SEARCH_CONCURRENCY', '4'))
+# Plafond par recherche, partagé par toutes les tuiles en mode 'local' : 60 appels
+# Nearby ≈ 1,92 $, sous le budget des modes 'tiled'/'local' (TILED_SEARCH_BUDGET_USD)
+TILED_SEARCH_MAX_CALLS = int(os.getenv('TILED_SEARCH_MAX_CALLS', '60'))
+TILED_SEARCH_MIN_CELL_M = int(os.getenv('TILED_SEARCH_MIN_CELL_M', '300'))
+TILED_SEARCH_MAX_DEPTH = int(os.getenv('TILED_SEARCH_MAX_DEPTH', '3'))
+
+
+class CallBudgetExceeded(Exception):
+    pass
+
+
+class _LimitedNearbyClient:
+    # Expose places_nearby avec limitation de débit et budget d'appels
+    # partagés par toutes les tuiles d'une même recherche.
+
+    def __init__(self, gmaps, limiter, max_calls):
+        self.gmaps = gmaps
+        self.limiter = limiter
+        self.max_calls = max_calls
+        self.calls = 0
+        self.quota_exceeded = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.quota_exceeded:
+                raise CallBudgetExceeded("Budget Google Maps épuisé")
+            if self.calls >= self.max_calls:
+                raise CallBudgetExceeded(f"Budget de {self.max_calls} appels Nearby Search atteint")
+            self.calls += 1
+        self.limiter.acquire()
+
+    def release(self):
+        # Appel non facturé (token de page pas encore valide) : rendu au plafond
+        with self._lock:
+            self.calls -= 1
+
+    def places_nearby(self, **kwargs):
+        try:
+            return self.gmaps.places_nearby(**kwargs)
+        except QuotaExceeded:
+            # Budget en dollars épuisé : les autres tuiles s'arrêtent sans appel
+            self.quota_exceeded = True
+            raise
+
+
+def limited_nearby_client(gmaps, max_calls=TILED_SEARCH_MAX_CALLS):
+    # Client Nearby Search à débit limité et plafond d'appels, à partager
+    # entre plusieurs recherches par tuiles (toutes les tuiles du mode 'local')
+    return _LimitedNearbyClient(gmaps, TokenBucket(TILED_SEARCH_QPS), max_calls)
+
+
+def places_nearby(gmaps, **kwargs):
+    # Le budget d'appels des tuiles est réservé avant l'appel, lui-même
+    # imputé au budget puis envoyé par MeteredMapsClient (quota.py)
+    acquire = getattr(gmaps, 'acquire', None)
+    if acquire:
+        acquire()
+    return gmaps.places_nearby(**kwargs)
+
+
+def fetch_next_page(gmaps, location, radius, keyword, page_token):
+    # Un token utilisé trop tôt renvoie INVALID_REQUEST : on réessaie avec
+    # une attente croissante plutôt qu'un sleep fixe de 2 secondes. Ces
+    # échecs ne sont pas facturés par Google : MeteredMapsClient les rembourse
+    # au budget et ils sont rendus au plafond d'appels des tuiles.
+    from googlemaps.exceptions import ApiError
+    time.sleep(PAGE_TOKEN_INITIAL_DELAY)
+    for attempt in range(1, PAGE_TOKEN_MAX_ATTEMPTS + 1):
+        try:
+            return places_nearby(
+                gmaps,
+                location=location,
+                radius=radius,
+                keyword=keyword,
+                page_token=page_token
+            )
+        except ApiError as e:
+            if e.status != 'INVALID_REQUEST':
+                raise
+            release = getattr(gmaps, 'release', None)
+            if release:
+                release()
+            if attempt == PAGE_TOKEN_MAX_ATTEMPTS:
+                raise
+            time.sleep(PAGE_TOKEN_RETRY_DELAY * attempt)
+
+
+def iter_nearby_pages(gmaps, location, radius, keyword, max_pages=MAX_NEARBY_PAGES):
+    # Produit les résultats Nearby Search page par page (radius en mètres).
+    # Une erreur sur la première page est propagée ; sur les pages suivantes
+    # elle arrête la pagination en gardant ce qui a déjà été produit.
+    places_result = places_nearby(
+        gmaps,
+        location=location,
+        radius=radius,
+        keyword=keyword
+    )
+    yield places_result.get('results', [])
+
+    pages = 1
+    while pages < max_pages and places_result.get('next_page_token'):
+        try:
+            places_result = fetch_next_page(gmaps, location, radius, keyword, places_result['next_page_token'])
+        except CallBudgetExceeded:
+            raise
+        except QuotaExceeded as e:
+            # Budget atteint : les pages déjà reçues sont servies
+            logger.info(f"Page {pages + 1} non demandée: {str(e)}")
+            return
+        except Exception as e:
+            logger.error(f"Erreur lors de la récupération de la page {pages + 1}: {str(e)}")
+            return
+        pages += 1
+        yield places_result.get('results', [])
+
+
+def _within(place, center, radius):
+    location = place.get('geometry', {}).get('location')
+    if not location:
+        return True
+    return haversine_m(center['lat'], center['lng'], location['lat'], location['lng']) <= radius
+
+
+def iter_tiled_places(gmaps, location, radius, keyword, max_calls=TILED_SEARCH_MAX_CALLS, stats=None):
+    # Découpe le cercle de recherche en cellules hexagonales qui se
+    # chevauchent, les interroge en parallèle sous limitation de débit et
+    # subdivise toute cellule qui atteint le plafond de 60 résultats.
+    # Produit, au fil des cellules terminées, des lots de lieux inédits
+    # (dédoublonnés par place_id et situés dans le cercle demandé).
+    # Un client de limited_nearby_client garde son propre plafond d'appels.
+    client = gmaps if isinstance(gmaps, _LimitedNearbyClient) else limited_nearby_client(gmaps, max_calls)
+    calls_before = client.calls
+    stats = stats if stats is not None else {}
+    stats.update({'cells': 0, 'subdivided': 0, 'calls': 0, 'truncated': False})
+
+    context = contextvars.copy_context()
+
+    def search_cell(cell, cell_radius):
+        return context.copy().run(_search_cell, cell, cell_radius)
+
+    def _search_cell(cell, cell_radius):
+        results = []
+        try:
+            for page in iter_nearby_pages(client, cell, int(cell_radius), keyword):
+                results.extend(page)
+        except (CallBudgetExceeded, QuotaExceeded):
+            stats['truncated'] = True
+        if client.quota_exceeded:
+            # Page suivante refusée par le budget (iter_nearby_pages s'arrête sans lever)
+            stats['truncated'] = True
+        return results
+
+    seen = set()
+    yielded = False
+    first_error = None
+    cell_radius = max(radius / 2, TILED_SEARCH_MIN_CELL_M)
+    cells = hex_cells(location, radius, cell_radius) if cell_radius < radius else [location]
+    cell_radius = min(cell_radius, radius)
+    executor = ThreadPoolExecutor(max_workers=max(1, TILED_SEARCH_CONCURRENCY))
+    try:
+        pending = {}
+        for cell in cells:
+            pending[executor.submit(search_cell, cell, cell_radius)] = (cell, cell_radius, 0)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                cell, cell_radius, depth = pending.pop(future)
+                stats['cells'] += 1
+                try:
+                    results = future.result()
+                except Exception as e:
+                    logger.error(f"Erreur Nearby Search sur une tuile: {str(e)}")
+                    first_error = first_error or e
+                    continue
+
+                # Cellule saturée : on la redécoupe en cellules deux fois plus petites
+                if len(results) >= NEARBY_RESULTS_CAP:
+                    child_radius = cell_radius / 2
+                    if child_radius >= TILED_SEARCH_MIN_CELL_M and depth < TILED_SEARCH_MAX_DEPTH:
+                        stats['subdivided'] += 1
+                        for child in hex_cells(cell, cell_radius, child_radius):
+                            if haversine_m(location['lat'], location['lng'], child['lat'], child['lng']) <= radius + child_radius:
+                                pending[executor.submit(search_cell, child, child_radius)] = (child, child_radius, depth + 1)
+
+                batch = []
+                for place in results:
+                    if place['place_id'] not in seen and _within(place, location, radius):
+                        seen.add(place['place_id'])
+                        batch.append(place)
+                if batch:
+                    yielded = True
+                    yield batch
+
+        if not yielded and first_error:
+            raise first_error
+    finally:
+        stats['calls'] = client.calls - calls_before
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,130 +1,249 @@
-from notion_client import Client
+import logging
+import os
 from datetime import datetime
-from constants import KEYWORD_SUGGESTIONS
+from clients import get_notion_client
+from export_manifest import export_manifest
+import upstream
+from notion_index import get_export_index
+from rate_limit import TokenBucket
+from taxonomy import taxonomy
+from text_utils import normalize_text
+from worker_pool import bounded_map
+
+logger = logging.getLogger(__name__)
+
+# Notion accepte en moyenne ~3 requêtes par seconde par intégration
+NOTION_RATE_LIMIT = float(os.getenv('NOTION_RATE_LIMIT', '3'))
+NOTION_EXPORT_CONCURRENCY = int(os.getenv('NOTION_EXPORT_CONCURRENCY', '3'))
+NOTION_MAX_RETRIES = int(os.getenv('NOTION_MAX_RETRIES', '5'))
+NOTION_RETRY_BASE_DELAY = float(os.getenv('NOTION_RETRY_BASE_DELAY', '0.5'))
+
+# Limiteur partagé par toutes les exportations du processus
+notion_rate_limiter = TokenBucket(NOTION_RATE_LIMIT)
+
+
+def is_rate_limited(error):
+    # 429 : Notion n'a pas traité la requête, la renvoyer ne crée pas de doublon
+    return upstream.http_status(error) == 429
 
 class NotionExporter:
     def __init__(self, token, database_id):
-        self.notion = Client(auth=token)
+        self.notion = get_notion_client(token)
         self.database_id = database_id
+        self.index = get_export_index(token, database_id)
+
+    def call_with_retry(self, func, operation='pages.create', **kwargs):
+        # Appel Notion limité en débit (attente hors chronométrage) ; réessais
+        # sur 429/5xx et erreurs réseau (Retry-After respecté) et coupe-circuit
+        # via upstream.call. Une création n'est renvoyée qu'après un 429 :
+        # après un 5xx ou un délai dépassé, la page a pu être créée.
+        retry_if = is_rate_limited if operation == 'pages.create' else None
+        return upstream.call('notion', operation, lambda: func(**kwargs), retries=NOTION_MAX_RETRIES,
+                             base_delay=NOTION_RETRY_BASE_DELAY, before=notion_rate_limiter.acquire, retry_if=retry_if)
 
     def export_business(self, business_data):
         try:
-            # Déterminer la catégorie et l'emoji
-            keyword = business_data.get('keyword', '').lower()
-            category = None
-            emoji = '🏢'  # Emoji par défaut
-            
-            for cat, data in KEYWORD_SUGGESTIONS.items():
-                if any(k.lower() in keyword for k in data['keywords']):
-                    category = cat
-                    emoji = data['emoji']
-                    break
-            
-            if not category:
-                category = "Autre"
-
             # Vérifier si l'entreprise existe déjà
             business_name = business_data.get('name', '')
-            existing_pages = self.notion.databases.query(
-                database_id=self.database_id,
-                filter={
-                    "property": "Name",
-                    "title": {
-                        "equals": business_name
+            place_id = business_data.get('id')
+            self.index.refresh()
+            existing_page = self.index.find(business_name, place_id)
+
+            if existing_page:
+                logger.info(f"L'entreprise {business_name} existe déjà dans Notion")
+                return existing_page
+
+            return self.create_page(business_data)
+
+        except Exception as e:
+            logger.error(f"Erreur détaillée lors de l'export vers Notion: {str(e)}")
+            return None
+
+    def export_many(self, businesses, max_workers=NOTION_EXPORT_CONCURRENCY):
+        # Export groupé et incrémental : le manifeste d'export indique ce qui a
+        # déjà été envoyé à cette base. Les entreprises inchangées sont
+        # ignorées, les modifiées mettent à jour leur page, seules les
+        # nouvelles passent par le dédoublonnage de l'index avant création.
+        # Renvoie un rapport par entreprise, dans l'ordre reçu.
+        destination = f'notion:{self.database_id}'
+        new, changed, unchanged = export_manifest.changes(destination, businesses)
+        pages = {id(business_data): page_id for business_data, page_id in changed + unchanged}
+        changed_ids = {id(business_data) for business_data, _ in changed}
+        if new:
+            self.index.refresh()
+
+        report = []
+        to_create = []
+        to_update = []
+        found = []
+        seen = set()
+        for business_data in businesses:
+            name = business_data.get('name', '')
+            place_id = business_data.get('id')
+            item = {'id': place_id, 'name': name}
+            keys = {normalize_text(name)} | ({place_id} if place_id else set())
+            page_id = pages.get(id(business_data))
+            if keys & seen:
+                item.update({'status': 'skipped', 'reason': 'duplicate'})
+            elif page_id and id(business_data) in changed_ids:
+                seen.update(keys)
+                to_update.append((item, business_data, page_id))
+            elif page_id:
+                seen.update(keys)
+                item.update({'status': 'skipped', 'reason': 'unchanged', 'page_id': page_id})
+            else:
+                seen.update(keys)
+                existing_page = self.index.find(name, place_id)
+                if existing_page:
+                    item.update({'status': 'skipped', 'reason': 'already_exported', 'page_id': existing_page.get('id')})
+                    found.append((business_data, existing_page.get('id')))
+                else:
+                    to_create.append((item, business_data, None))
+            report.append(item)
+
+        def send(entry):
+            item, business_data, page_id = entry
+            try:
+                if page_id:
+                    self.update_page(page_id, business_data)
+                    item.update({'status': 'updated', 'page_id': page_id})
+                else:
+                    page = self.create_page(business_data)
+                    item.update({'status': 'created', 'page_id': page.get('id')})
+                return business_data, item['page_id']
+            except Exception as e:
+                logger.error(f"Erreur lors de l'export vers Notion pour {item['name']}: {str(e)}")
+                item.update({'status': 'failed', 'error': str(e)})
+                return None, None
+
+        sent = bounded_map(send, to_update + to_create, max_workers=max_workers)
+        # Les pages trouvées dans l'index sont aussi consignées : elles ne
+        # seront plus recherchées aux exports suivants
+        export_manifest.record(destination, found + [entry for entry in sent if entry and entry[0] is not None])
+        return report
+
+    def data_properties(self, business_data):
+        # Propriétés issues de la fiche Google, réécrites à chaque mise à jour ;
+        # les champs de suivi commercial (Titulaire, Contact...) ne sont fixés qu'à la création
+        category = taxonomy.category(business_data.get('keyword', ''))
+        place_id = business_data.get('id')
+
+        properties = {
+            "Name": {
+                "title": [
+                    {
+                        "text": {
+                            "content": business_data.get('name', 'Sans nom')
+                        }
                     }
-                }
-            )
-
-            if existing_pages.get('results'):
-                print(f"L'entreprise {business_name} existe déjà dans Notion")
-                return existing_pages['results'][0]
-
-            properties = {
-                "Name": {
-                    "title": [
-                        {
-                            "text": {
-                                "content": business_data.get('name', 'Sans nom')
-                            }
+                ]
+            },
+            "Checker": {
+                "rich_text": [
+                    {
+                        "text": {
+                            "content": self.check_data_completeness(business_data)
                         }
-                    ]
-                },
-                "Titulaire": {
-                    "people": []
-                },
-                "Checker": {
-                    "rich_text": [
-                        {
-                            "text": {
-                                "content": self.check_data_completeness(business_data)
-                            }
+                    }
+                ]
+            },
+            "Industrie": {
+                "rich_text": [
+                    {
+                        "text": {
+                            "content": category
                         }
-                    ]
-                },
-                "Dernier contact": {
-                    "date": {
-                        "start": datetime.now().strftime("%Y-%m-%d")
                     }
-                },
-                "Contact": {
-                    "rich_text": [
-                        {
-                            "text": {
-                                "content": "À contacter"
-                            }
+                ]
+            },
+            "Adresse": {
+                "rich_text": [
+                    {
+                        "text": {
+                            "content": business_data.get('address', 'Non renseignée')
                         }
-                    ]
-                },
-                "Industrie": {
-                    "rich_text": [
-                        {
-                            "text": {
-                                "content": category
-                            }
+                    }
+                ]
+            },
+            "Numéro de téléphone": {
+                "phone_number": business_data.get('phone') or None
+            },
+            "Site web": {
+                "url": business_data.get('website') or None
+            }
+        }
+
+        if self.index.place_id_property and place_id:
+            properties[self.index.place_id_property] = {
+                "rich_text": [
+                    {
+                        "text": {
+                            "content": place_id
                         }
-                    ]
-                },
-                "Adresse": {
-                    "rich_text": [
-                        {
-                            "text": {
-                                "content": business_data.get('address', 'Non renseignée')
-                            }
+                    }
+                ]
+            }
+        return properties
+
+    def create_page(self, business_data):
+        # Déterminer l'emoji de la catégorie
+        _, emoji = taxonomy.category_and_emoji(business_data.get('keyword', ''))
+
+        business_name = business_data.get('name', '')
+        place_id = business_data.get('id')
+
+        properties = self.data_properties(business_data)
+        properties.update({
+            "Titulaire": {
+                "people": []
+            },
+            "Dernier contact": {
+                "date": {
+                    "start": datetime.now().strftime("%Y-%m-%d")
+                }
+            },
+            "Contact": {
+                "rich_text": [
+                    {
+                        "text": {
+                            "content": "À contacter"
                         }
-                    ]
-                },
-                "Numéro de téléphone": {
-                    "phone_number": business_data.get('phone') or None
-                },
-                "Email": {
-                    "email": None
-                },
-                "Site web": {
-                    "url": business_data.get('website') or None
-                },
-                "Montant": {
-                    "number": None
-                },
-                "Source": {
-                    "select": {
-                        "name": "Pro Finder"
                     }
+                ]
+            },
+            "Email": {
+                "email": None
+            },
+            "Montant": {
+                "number": None
+            },
+            "Source": {
+                "select": {
+                    "name": "Pro Finder"
                 }
             }
+        })
 
-            new_page = self.notion.pages.create(
-                parent={"database_id": self.database_id},
-                properties=properties,
-                icon={
-                    "type": "emoji",
-                    "emoji": emoji
-                }
-            )
-            return new_page
-        
-        except Exception as e:
-            print(f"Erreur détaillée lors de l'export vers Notion: {str(e)}")
-            return None
+        new_page = self.call_with_retry(
+            self.notion.pages.create,
+            parent={"database_id": self.database_id},
+            properties=properties,
+            icon={
+                "type": "emoji",
+                "emoji": emoji
+            }
+        )
+        self.index.add(new_page, name=business_name, place_id=place_id)
+        return new_page
+
+    def update_page(self, page_id, business_data):
+        # Réécrit les propriétés de la fiche sur une page déjà exportée
+        return self.call_with_retry(
+            self.notion.pages.update,
+            operation='pages.update',
+            page_id=page_id,
+            properties=self.data_properties(business_data)
+        )
 
     def check_data_completeness(self, business_data):
         # Vérifier les champs obligatoires
@@ -134,27 +253,12 @@ class NotionExporter:
         return "Informations incomplètes"
 
     def get_business_category(self, keyword):
-        # Référence au KEYWORD_SUGGESTIONS défini dans app.py
-        keyword = keyword.lower()
-        from app import KEYWORD_SUGGESTIONS  # Import local pour éviter les imports circulaires
-        
-        for category, keywords in KEYWORD_SUGGESTIONS.items():
-            if any(k.lower() in keyword for k in keywords):
-                return category
-        return "Autre"  # Catégorie par défaut si aucune correspondance
-
-    def check_business_exists(self, business_name):
+        return taxonomy.category(keyword)
+
+    def check_business_exists(self, business_name, place_id=None):
         try:
-            existing_pages = self.notion.databases.query(
-                database_id=self.database_id,
-                filter={
-                    "property": "Name",
-                    "title": {
-                        "equals": business_name
-                    }
-                }
-            )
-            return bool(existing_pages.get('results'))
+            self.index.refresh()
+            return self.index.is_exported(business_name, place_id)
         except Exception as e:
-            print(f"Erreur lors de la vérification: {str(e)}")
+            logger.error(f"Erreur lors de la vérification: {str(e)}")
             return False
\ No newline at end of file
@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+import time
+from clients import get_notion_client
+import upstream
+from text_utils import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Durée de vie de l'index avant un rechargement complet (secondes)
+NOTION_INDEX_TTL = int(os.getenv('NOTION_INDEX_TTL', '900'))
+# Intervalle minimum entre deux rafraîchissements incrémentaux (secondes)
+NOTION_INDEX_REFRESH = int(os.getenv('NOTION_INDEX_REFRESH', '60'))
+# Propriété Notion (texte) contenant le place_id Google, optionnelle
+NOTION_PLACE_ID_PROPERTY = os.getenv('NOTION_PLACE_ID_PROPERTY')
+
+
+class NotionExportIndex:
+    # Index en mémoire des entreprises déjà présentes dans la base Notion.
+    # Chargé une fois via la pagination de databases.query, puis complété
+    # par des requêtes filtrées sur last_edited_time. Les pages supprimées
+    # dans Notion ne disparaissent qu'au rechargement complet (TTL).
+
+    def __init__(self, notion, database_id, ttl=NOTION_INDEX_TTL,
+                 refresh_interval=NOTION_INDEX_REFRESH, place_id_property=NOTION_PLACE_ID_PROPERTY):
+        self.notion = notion
+        self.database_id = database_id
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.place_id_property = place_id_property
+        self._lock = threading.Lock()
+        self._by_name = {}
+        self._by_place_id = {}
+        self._loaded_at = None
+        self._synced_at = None
+        self._last_edited = None
+
+    @property
+    def ready(self):
+        return self._loaded_at is not None
+
+    def _query_all(self, query_filter=None):
+        cursor = None
+        while True:
+            kwargs = {'database_id': self.database_id, 'page_size': 100}
+            if query_filter:
+                kwargs['filter'] = query_filter
+            if cursor:
+                kwargs['start_cursor'] = cursor
+            response = upstream.call('notion', 'databases.query',
+                                     lambda: self.notion.databases.query(**kwargs), hedge=True)
+            for page in response.get('results', []):
+                yield page
+            if not response.get('has_more') or not response.get('next_cursor'):
+                break
+            cursor = response['next_cursor']
+
+    def _page_name(self, page):
+        title = page.get('properties', {}).get('Name', {}).get('title', [])
+        return ''.join(part.get('plain_text') or part.get('text', {}).get('content', '') for part in title)
+
+    def _page_place_id(self, page):
+        if not self.place_id_property:
+            return None
+        prop = page.get('properties', {}).get(self.place_id_property, {})
+        text = ''.join(part.get('plain_text') or part.get('text', {}).get('content', '')
+                       for part in prop.get('rich_text', []))
+        return text or None
+
+    def _index_page(self, page, by_name, by_place_id):
+        entry = {'id': page.get('id'), 'url': page.get('url')}
+        name_key = normalize_text(self._page_name(page))
+        if name_key:
+            by_name[name_key] = entry
+        place_id = self._page_place_id(page)
+        if place_id:
+            by_place_id[place_id] = entry
+        edited = page.get('last_edited_time')
+        if edited and (self._last_edited is None or edited > self._last_edited):
+            self._last_edited = edited
+
+    def refresh(self, force=False):
+        # Recharge tout si l'index a expiré, sinon récupère seulement les pages modifiées
+        with self._lock:
+            now = time.monotonic()
+            try:
+                if force or self._loaded_at is None or now - self._loaded_at > self.ttl:
+                    by_name, by_place_id = {}, {}
+                    self._last_edited = None
+                    for page in self._query_all():
+                        self._index_page(page, by_name, by_place_id)
+                    self._by_name, self._by_place_id = by_name, by_place_id
+                    self._loaded_at = self._synced_at = now
+                    logger.info(f"✓ Index Notion chargé: {len(by_name)} entreprise(s)")
+                elif now - self._synced_at > self.refresh_interval:
+                    query_filter = None
+                    if self._last_edited:
+                        query_filter = {
+                            "timestamp": "last_edited_time",
+                            "last_edited_time": {"on_or_after": self._last_edited}
+                        }
+                    for page in self._query_all(query_filter):
+                        self._index_page(page, self._by_name, self._by_place_id)
+                    self._synced_at = now
+            except Exception as e:
+                logger.error(f"Erreur lors du chargement de l'index Notion: {str(e)}")
+
+    def find(self, name, place_id=None):
+        if place_id and place_id in self._by_place_id:
+            return self._by_place_id[place_id]
+        return self._by_name.get(normalize_text(name))
+
+    def is_exported(self, name, place_id=None):
+        return self.find(name, place_id) is not None
+
+    def add(self, page, name=None, place_id=None):
+        # Enregistre une page créée localement sans attendre le prochain rafraîchissement
+        entry = {'id': page.get('id'), 'url': page.get('url')}
+        with self._lock:
+            name_key = normalize_text(name or self._page_name(page))
+            if name_key:
+                self._by_name[name_key] = entry
+            place_id = place_id or self._page_place_id(page)
+            if place_id:
+                self._by_place_id[place_id] = entry
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_export_index(token, database_id):
+    # Un index partagé par base Notion et par processus
+    with _indexes_lock:
+        index = _indexes.get(database_id)
+        if index is None:
+            index = NotionExportIndex(get_notion_client(token), database_id)
+            _indexes[database_id] = index
+        return index
@@ -0,0 +1,255 @@
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from cache_store import CACHE_DB_PATH
+from geo import METERS_PER_DEGREE, haversine_m
+from text_utils import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Base locale des entreprises découvertes, indexée dans l'espace (R-tree sur
+# lat/lng) et étiquetée par mot-clé. Une grille fixe de tuiles mémorise les
+# zones déjà parcourues pour chaque mot-clé : une recherche sur une zone
+# couverte se résout localement, seules les tuiles manquantes ou périmées
+# repartent vers Google.
+PLACE_STORE_PATH = os.getenv('PLACE_STORE_PATH', CACHE_DB_PATH)
+# Côté d'une tuile de couverture (mètres)
+PLACE_STORE_TILE_M = int(os.getenv('PLACE_STORE_TILE_M', '2500'))
+# Au-delà, une tuile ou une fiche est considérée comme périmée (14 jours par défaut)
+PLACE_STORE_TTL = int(os.getenv('PLACE_STORE_TTL', str(14 * 24 * 3600)))
+# Tuile parcourue en partie (plafond d'appels ou budget atteint) : ses lieux
+# sont servis localement pendant ce délai avant une nouvelle tentative (1 jour)
+PLACE_STORE_PARTIAL_TTL = int(os.getenv('PLACE_STORE_PARTIAL_TTL', str(24 * 3600)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS places (
+    id INTEGER PRIMARY KEY,
+    place_id TEXT NOT NULL UNIQUE,
+    lat REAL NOT NULL,
+    lng REAL NOT NULL,
+    enriched INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS place_keywords (
+    keyword TEXT NOT NULL,
+    place_id TEXT NOT NULL,
+    PRIMARY KEY (keyword, place_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tile_coverage (
+    keyword TEXT NOT NULL,
+    tile TEXT NOT NULL,
+    found INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    complete INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (keyword, tile)
+) WITHOUT ROWID;
+"""
+_RTREE_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS places_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng);"
+# SQLite compilé sans R-tree : simple index B-tree sur les coordonnées
+_FALLBACK_SCHEMA = "CREATE INDEX IF NOT EXISTS idx_places_lat_lng ON places (lat, lng);"
+
+
+def _tile(row, col):
+    tile_lat = PLACE_STORE_TILE_M / METERS_PER_DEGREE
+    min_lat = row * tile_lat
+    tile_lng = PLACE_STORE_TILE_M / (METERS_PER_DEGREE * math.cos(math.radians(min_lat + tile_lat / 2)))
+    min_lng = col * tile_lng
+    return {
+        'key': f'{row}:{col}',
+        'bounds': (min_lat, min_lat + tile_lat, min_lng, min_lng + tile_lng),
+        'center': {'lat': min_lat + tile_lat / 2, 'lng': min_lng + tile_lng / 2},
+        # Cercle circonscrit : une recherche Nearby de ce rayon couvre toute la tuile
+        'radius': int(math.ceil(PLACE_STORE_TILE_M * math.sqrt(2) / 2))
+    }
+
+
+def tile_contains(tile, location):
+    min_lat, max_lat, min_lng, max_lng = tile['bounds']
+    return min_lat <= location['lat'] < max_lat and min_lng <= location['lng'] < max_lng
+
+
+def tile_grid(location, radius):
+    # Tuiles de la grille fixe qui touchent le cercle (location, radius en mètres).
+    # Les lignes suivent la latitude ; la largeur en longitude de chaque ligne
+    # est calculée à sa latitude centrale.
+    tile_lat = PLACE_STORE_TILE_M / METERS_PER_DEGREE
+    dlat = radius / METERS_PER_DEGREE
+    tiles = []
+    for row in range(math.floor((location['lat'] - dlat) / tile_lat), math.floor((location['lat'] + dlat) / tile_lat) + 1):
+        tile_lng = _tile(row, 0)['bounds'][3]
+        dlng = radius / (METERS_PER_DEGREE * math.cos(math.radians(location['lat'])))
+        for col in range(math.floor((location['lng'] - dlng) / tile_lng) - 1, math.floor((location['lng'] + dlng) / tile_lng) + 2):
+            tile = _tile(row, col)
+            min_lat, max_lat, min_lng, max_lng = tile['bounds']
+            # Point de la tuile le plus proche du centre
+            lat = min(max(location['lat'], min_lat), max_lat)
+            lng = min(max(location['lng'], min_lng), max_lng)
+            if haversine_m(location['lat'], location['lng'], lat, lng) <= radius:
+                tiles.append(tile)
+    return tiles
+
+
+class PlaceStore:
+    # Même modèle que SQLiteCache : une connexion par thread, mode WAL
+
+    def __init__(self, path=PLACE_STORE_PATH, ttl=PLACE_STORE_TTL, partial_ttl=PLACE_STORE_PARTIAL_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.partial_ttl = partial_ttl
+        self.rtree = None
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            # Bases créées avant la colonne complete : toutes leurs tuiles étaient complètes
+            if 'complete' not in {row[1] for row in conn.execute("PRAGMA table_info(tile_coverage)")}:
+                try:
+                    conn.execute("ALTER TABLE tile_coverage ADD COLUMN complete INTEGER NOT NULL DEFAULT 1")
+                except sqlite3.OperationalError:
+                    pass  # colonne ajoutée entre-temps par un autre worker
+            try:
+                conn.execute(_RTREE_SCHEMA)
+                self.rtree = True
+            except sqlite3.OperationalError:
+                logger.warning("Module R-tree SQLite indisponible, index B-tree sur lat/lng")
+                conn.execute(_FALLBACK_SCHEMA)
+                self.rtree = False
+            self._local.conn = conn
+        return conn
+
+    def save(self, entreprises, keyword=None):
+        # Enregistre des entreprises (format des réponses de recherche) et les
+        # étiquette avec le mot-clé. Une fiche enrichie n'est jamais remplacée
+        # par le simple résultat Nearby Search du même lieu.
+        rows = [e for e in entreprises if e and e.get('lat') is not None and e.get('lng') is not None]
+        if not rows:
+            return
+        keyword = normalize_text(keyword) if keyword else None
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for entreprise in rows:
+                    data = {k: v for k, v in entreprise.items() if k not in ('alreadyExported', 'degraded')}
+                    conn.execute(
+                        "INSERT INTO places (place_id, lat, lng, enriched, data, fetched_at) VALUES (?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (place_id) DO UPDATE SET lat = excluded.lat, lng = excluded.lng, "
+                        "data = CASE WHEN excluded.enriched >= places.enriched THEN excluded.data ELSE places.data END, "
+                        "fetched_at = CASE WHEN excluded.enriched >= places.enriched THEN excluded.fetched_at ELSE places.fetched_at END, "
+                        "enriched = MAX(places.enriched, excluded.enriched)",
+                        (entreprise['id'], entreprise['lat'], entreprise['lng'], int(bool(entreprise.get('enriched'))),
+                         json.dumps(data, ensure_ascii=False), now)
+                    )
+                    if self.rtree:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO places_rtree (id, min_lat, max_lat, min_lng, max_lng) "
+                            "SELECT id, lat, lat, lng, lng FROM places WHERE place_id = ?",
+                            (entreprise['id'],)
+                        )
+                    if keyword:
+                        conn.execute("INSERT OR IGNORE INTO place_keywords (keyword, place_id) VALUES (?, ?)",
+                                     (keyword, entreprise['id']))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except Exception as e:
+            logger.error(f"Erreur d'écriture dans la base locale des lieux: {str(e)}")
+
+    def missing_tiles(self, keyword, tiles):
+        # Tuiles jamais parcourues pour ce mot-clé, ou parcourues il y a plus de
+        # ttl secondes (partial_ttl pour une tuile parcourue en partie)
+        if not tiles:
+            return []
+        now = time.time()
+        try:
+            conn = self._connect()
+            placeholders = ','.join('?' * len(tiles))
+            fresh = {row[0] for row in conn.execute(
+                f"SELECT tile FROM tile_coverage WHERE keyword = ? "
+                f"AND fetched_at >= CASE WHEN complete THEN ? ELSE ? END AND tile IN ({placeholders})",
+                (normalize_text(keyword), now - self.ttl, now - self.partial_ttl, *(tile['key'] for tile in tiles))
+            )}
+        except Exception as e:
+            logger.error(f"Erreur de lecture de la couverture locale: {str(e)}")
+            fresh = set()
+        return [tile for tile in tiles if tile['key'] not in fresh]
+
+    def mark_covered(self, keyword, tile, found, complete=True):
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO tile_coverage (keyword, tile, found, fetched_at, complete) VALUES (?, ?, ?, ?, ?)",
+                (normalize_text(keyword), tile['key'], found, time.time(), int(complete))
+            )
+        except Exception as e:
+            logger.error(f"Erreur d'écriture de la couverture locale: {str(e)}")
+
+    def query(self, keyword, location, radius):
+        # Entreprises du mot-clé dans le cercle, de la plus proche à la plus
+        # éloignée. Une fiche enrichie mais périmée revient avec enriched=False
+        # pour être rafraîchie par l'appelant.
+        dlat = radius / METERS_PER_DEGREE
+        dlng = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(location['lat'])), 1e-6))
+        bbox = (location['lat'] - dlat, location['lat'] + dlat, location['lng'] - dlng, location['lng'] + dlng)
+        try:
+            conn = self._connect()
+            if self.rtree:
+                rows = conn.execute(
+                    "SELECT p.data, p.lat, p.lng, p.fetched_at FROM places_rtree r "
+                    "JOIN places p ON p.id = r.id "
+                    "JOIN place_keywords k ON k.place_id = p.place_id AND k.keyword = ? "
+                    "WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lng >= ? AND r.min_lng <= ?",
+                    (normalize_text(keyword), *bbox)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT p.data, p.lat, p.lng, p.fetched_at FROM places p "
+                    "JOIN place_keywords k ON k.place_id = p.place_id AND k.keyword = ? "
+                    "WHERE p.lat BETWEEN ? AND ? AND p.lng BETWEEN ? AND ?",
+                    (normalize_text(keyword), *bbox)
+                ).fetchall()
+        except Exception as e:
+            logger.error(f"Erreur de lecture de la base locale des lieux: {str(e)}")
+            return []
+
+        stale_before = time.time() - self.ttl
+        found = []
+        for data, lat, lng, fetched_at in rows:
+            distance = haversine_m(location['lat'], location['lng'], lat, lng)
+            if distance > radius:
+                continue
+            entreprise = json.loads(data)
+            if fetched_at < stale_before:
+                entreprise['enriched'] = False
+            found.append((distance, entreprise))
+        found.sort(key=lambda item: item[0])
+        return [entreprise for _, entreprise in found]
+
+    def stats(self):
+        try:
+            conn = self._connect()
+            return {
+                'places': conn.execute("SELECT COUNT(*) FROM places").fetchone()[0],
+                'enriched': conn.execute("SELECT COUNT(*) FROM places WHERE enriched = 1").fetchone()[0],
+                'keywords': conn.execute("SELECT COUNT(DISTINCT keyword) FROM place_keywords").fetchone()[0],
+                'tiles': conn.execute("SELECT COUNT(*) FROM tile_coverage").fetchone()[0],
+                'partial_tiles': conn.execute("SELECT COUNT(*) FROM tile_coverage WHERE NOT complete").fetchone()[0],
+                'rtree': self.rtree
+            }
+        except Exception as e:
+            logger.error(f"Erreur de lecture des statistiques de la base locale: {str(e)}")
+            return {}
+
+
+place_store = PlaceStore()
@@ -0,0 +1,262 @@
+import contextvars
+import logging
+import os
+import sqlite3
+import threading
+import time
+from cache_store import CACHE_DB_PATH
+from metrics import Counter, REGISTRY
+from rate_limit import TokenBucket
+import upstream
+
+logger = logging.getLogger(__name__)
+
+# Budget des appels Google Maps facturables, en dollars US. Chaque appel est
+# imputé avant d'être envoyé à la requête HTTP en cours, à l'utilisateur
+# (par jour) et au compte (par mois) ; le cumul utilisateur et global est
+# partagé par tous les workers via SQLite.
+QUOTA_DB_PATH = os.getenv('QUOTA_DB_PATH', CACHE_DB_PATH)
+QUOTA_REQUEST_BUDGET_USD = float(os.getenv('QUOTA_REQUEST_BUDGET_USD', '3'))
+QUOTA_USER_DAILY_BUDGET_USD = float(os.getenv('QUOTA_USER_DAILY_BUDGET_USD', '25'))
+QUOTA_MONTHLY_BUDGET_USD = float(os.getenv('QUOTA_MONTHLY_BUDGET_USD', '200'))
+# Sous cette part du budget mensuel restant, les appels passent par un limiteur de débit
+QUOTA_THROTTLE_THRESHOLD = float(os.getenv('QUOTA_THROTTLE_THRESHOLD', '0.2'))
+QUOTA_THROTTLED_QPS = float(os.getenv('QUOTA_THROTTLED_QPS', '2'))
+
+# Prix unitaires (USD par appel) des SKU Places/Geocoding
+SKU_COSTS = {
+    'geocoding': 0.005,
+    'nearby_search': 0.032,
+    'place_details': 0.017,
+    'contact_data': 0.003,
+    'atmosphere_data': 0.005
+}
+# Champs Place Details facturés en supplément (Contact Data, Atmosphere Data)
+CONTACT_FIELDS = {'formatted_phone_number', 'international_phone_number', 'opening_hours',
+                  'current_opening_hours', 'website'}
+ATMOSPHERE_FIELDS = {'price_level', 'rating', 'reviews', 'user_ratings_total'}
+
+maps_cost = Counter('api_finder_maps_cost_usd_total', 'Coût estimé des appels Google Maps', ('sku',))
+quota_rejections = Counter('api_finder_quota_rejections_total', 'Appels refusés faute de budget', ('scope',))
+maps_refunds = Counter('api_finder_maps_refunds_usd_total', 'Appels Google Maps imputés puis non facturés', ('sku',))
+REGISTRY.extend([maps_cost, quota_rejections, maps_refunds])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quota_usage (
+    scope TEXT PRIMARY KEY,
+    cost REAL NOT NULL DEFAULT 0,
+    calls INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, scope, message):
+        super().__init__(message)
+        self.scope = scope
+
+
+def details_skus(fields):
+    skus = ['place_details']
+    fields = set(fields or [])
+    if fields & CONTACT_FIELDS:
+        skus.append('contact_data')
+    if fields & ATMOSPHERE_FIELDS:
+        skus.append('atmosphere_data')
+    return skus
+
+
+class UsageStore:
+    # Cumuls de coût par portée ("month:2024-05", "user:<id>:2024-05-17")
+
+    def __init__(self, path=QUOTA_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get(self, scope):
+        try:
+            row = self._connect().execute("SELECT cost FROM quota_usage WHERE scope = ?", (scope,)).fetchone()
+            return row[0] if row else 0.0
+        except Exception as e:
+            logger.error(f"Erreur de lecture du quota {scope}: {str(e)}")
+            return 0.0
+
+    def add(self, scope, cost, calls=1):
+        try:
+            self._connect().execute(
+                "INSERT INTO quota_usage (scope, cost, calls, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (scope) DO UPDATE SET cost = cost + excluded.cost, calls = calls + excluded.calls, "
+                "updated_at = excluded.updated_at",
+                (scope, cost, calls, time.time())
+            )
+        except Exception as e:
+            logger.error(f"Erreur d'écriture du quota {scope}: {str(e)}")
+
+
+class RequestBudget:
+    # Dépense d'une requête HTTP, partagée par les threads qui la servent
+
+    def __init__(self, user, limit):
+        self.user = user
+        self.limit = limit
+        self.cost = 0.0
+        self.calls = {}
+        self.exhausted = None
+        self._lock = threading.Lock()
+
+    def reserve(self, skus, cost):
+        with self._lock:
+            if self.cost + cost > self.limit:
+                return False
+            self.cost += cost
+            for sku in skus:
+                self.calls[sku] = self.calls.get(sku, 0) + 1
+            return True
+
+    def release(self, skus, cost):
+        with self._lock:
+            self.cost = max(0.0, self.cost - cost)
+            for sku in skus:
+                self.calls[sku] = max(0, self.calls.get(sku, 0) - 1)
+
+    def summary(self):
+        with self._lock:
+            return {
+                'cost_usd': round(self.cost, 4),
+                'budget_usd': self.limit,
+                'calls': dict(self.calls),
+                'exhausted': self.exhausted
+            }
+
+
+current_budget = contextvars.ContextVar('quota_budget', default=None)
+
+
+class QuotaManager:
+    def __init__(self, store=None, request_budget=QUOTA_REQUEST_BUDGET_USD,
+                 user_daily_budget=QUOTA_USER_DAILY_BUDGET_USD, monthly_budget=QUOTA_MONTHLY_BUDGET_USD,
+                 throttle_threshold=QUOTA_THROTTLE_THRESHOLD, throttled_qps=QUOTA_THROTTLED_QPS):
+        self.store = store or UsageStore()
+        self.request_budget = request_budget
+        self.user_daily_budget = user_daily_budget
+        self.monthly_budget = monthly_budget
+        self.throttle_threshold = throttle_threshold
+        self.limiter = TokenBucket(throttled_qps)
+        self._throttling = False
+
+    def start_request(self, user, limit=None):
+        budget = RequestBudget(user, limit if limit is not None else self.request_budget)
+        current_budget.set(budget)
+        return budget
+
+    def _scopes(self, user):
+        now = time.gmtime()
+        month = f"month:{time.strftime('%Y-%m', now)}"
+        day = f"user:{user}:{time.strftime('%Y-%m-%d', now)}" if user else None
+        return month, day
+
+    def _reject(self, scope, message, budget):
+        quota_rejections.inc(scope=scope)
+        if budget and not budget.exhausted:
+            budget.exhausted = scope
+        raise QuotaExceeded(scope, message)
+
+    def charge(self, skus):
+        # Impute les SKU d'un appel à venir ; QuotaExceeded si un budget serait dépassé
+        cost = sum(SKU_COSTS[sku] for sku in skus)
+        budget = current_budget.get()
+        month, day = self._scopes(budget.user if budget else None)
+
+        spent = self.store.get(month)
+        if spent + cost > self.monthly_budget:
+            self._reject('global', "Budget mensuel Google Maps épuisé", budget)
+        if day and self.store.get(day) + cost > self.user_daily_budget:
+            self._reject('user', "Budget quotidien Google Maps de l'utilisateur épuisé", budget)
+
+        # Budget presque épuisé : on étale les appels plutôt que de tout consommer
+        # d'un coup, sans attendre au-delà du délai de la requête HTTP
+        throttling = self.monthly_budget - spent < self.throttle_threshold * self.monthly_budget
+        if throttling != self._throttling:
+            self._throttling = throttling
+            if throttling:
+                logger.warning(f"Budget Google Maps bas ({spent:.2f} $ / {self.monthly_budget:.2f} $), appels limités")
+        if throttling and not self.limiter.acquire(timeout=upstream.remaining()):
+            raise upstream.DeadlineExceeded('google_maps', "Délai écoulé en attente du limiteur de budget Google Maps")
+
+        if budget and not budget.reserve(skus, cost):
+            self._reject('request', f"Budget de {budget.limit:.2f} $ par recherche atteint", budget)
+
+        self.store.add(month, cost)
+        if day:
+            self.store.add(day, cost)
+        for sku in skus:
+            maps_cost.inc(SKU_COSTS[sku], sku=sku)
+
+    def refund(self, skus):
+        # Annule l'imputation d'un appel que Google n'a pas facturé
+        cost = sum(SKU_COSTS[sku] for sku in skus)
+        budget = current_budget.get()
+        if budget:
+            budget.release(skus, cost)
+        month, day = self._scopes(budget.user if budget else None)
+        self.store.add(month, -cost, -1)
+        if day:
+            self.store.add(day, -cost, -1)
+        for sku in skus:
+            maps_refunds.inc(SKU_COSTS[sku], sku=sku)
+
+    def usage(self, user=None):
+        month, day = self._scopes(user)
+        usage = {'month': {'spent_usd': round(self.store.get(month), 4), 'budget_usd': self.monthly_budget}}
+        if day:
+            usage['user_today'] = {'spent_usd': round(self.store.get(day), 4), 'budget_usd': self.user_daily_budget}
+        usage['request_budget_usd'] = self.request_budget
+        usage['throttling'] = self._throttling
+        return usage
+
+
+quota_manager = QuotaManager()
+
+
+class MeteredMapsClient:
+    # Client googlemaps dont les appels facturables passent par le budget et
+    # par upstream.call (les autres méthodes sont déléguées telles quelles).
+    # L'imputation et l'éventuelle attente du limiteur précèdent chaque
+    # tentative sans compter dans sa latence ni dans son délai.
+
+    def __init__(self, client, quota=quota_manager):
+        self.client = client
+        self.quota = quota
+
+    def _call(self, operation, skus, func):
+        # Pas de requête doublée : chaque appel Google Maps est facturé
+        return upstream.call('google_maps', operation, func, before=lambda: self.quota.charge(skus))
+
+    def geocode(self, *args, **kwargs):
+        return self._call('geocode', ['geocoding'], lambda: self.client.geocode(*args, **kwargs))
+
+    def places_nearby(self, **kwargs):
+        try:
+            return self._call('places_nearby', ['nearby_search'], lambda: self.client.places_nearby(**kwargs))
+        except Exception as e:
+            # next_page_token pas encore valide (INVALID_REQUEST) : Google ne
+            # facture pas l'appel, fetch_next_page réessaie un peu plus tard
+            if kwargs.get('page_token') and getattr(e, 'status', None) == 'INVALID_REQUEST':
+                self.quota.refund(['nearby_search'])
+            raise
+
+    def place(self, place_id, fields=None, **kwargs):
+        return self._call('place', details_skus(fields), lambda: self.client.place(place_id, fields=fields, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
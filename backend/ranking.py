@@ -0,0 +1,109 @@
+from geo import EARTH_RADIUS_M
+
+# Post-traitement des résultats de recherche, vectorisé sur l'ensemble des
+# lignes : distance au centre, rayon réel, filtres et tri côté serveur.
+#   sort=-rating,distance     clés séparées par des virgules, "-" pour l'ordre décroissant
+#   max_distance=2.5          km
+#   min_rating=4              note minimale
+#   min_ratings=20            nombre minimal d'avis (total_ratings)
+#   business_status=OPERATIONAL,CLOSED_TEMPORARILY
+SORT_KEYS = ('distance', 'rating', 'total_ratings', 'business_status')
+# numpy n'est importé qu'au premier classement : un démarrage à froid ne le
+# charge pas pour les routes qui ne trient rien
+
+
+def _floats(entreprises, key):
+    # 'N/A', '' ou None deviennent NaN (relégués en fin de tri, exclus des filtres)
+    import numpy as np
+    values = np.full(len(entreprises), np.nan)
+    for i, entreprise in enumerate(entreprises):
+        try:
+            values[i] = float(entreprise.get(key))
+        except (TypeError, ValueError):
+            pass
+    return values
+
+
+def distances_km(entreprises, location):
+    # Haversine du centre de recherche vers chaque entreprise, en une passe.
+    # location est un point unique, ou une liste de points (un centre par ligne).
+    import numpy as np
+    lat = np.radians(_floats(entreprises, 'lat'))
+    lng = np.radians(_floats(entreprises, 'lng'))
+    if isinstance(location, dict):
+        lat0, lng0 = np.radians(location['lat']), np.radians(location['lng'])
+    else:
+        lat0 = np.radians(np.array([point['lat'] for point in location], dtype=float))
+        lng0 = np.radians(np.array([point['lng'] for point in location], dtype=float))
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lat) * np.sin((lng - lng0) / 2) ** 2
+    return 2 * EARTH_RADIUS_M / 1000 * np.arcsin(np.sqrt(a))
+
+
+def parse_ranking_params(source):
+    # Paramètres de requête (args ou corps JSON) ; ValueError si invalides
+    params = {}
+    sort = source.get('sort')
+    if sort:
+        keys = [key.strip() for key in str(sort).split(',') if key.strip()]
+        for key in keys:
+            if key.lstrip('-') not in SORT_KEYS:
+                raise ValueError(f"Tri inconnu '{key}' (valeurs possibles : {', '.join(SORT_KEYS)})")
+        params['sort'] = keys
+    for name in ('max_distance', 'min_rating', 'min_ratings'):
+        if source.get(name) not in (None, ''):
+            try:
+                params[name] = float(source.get(name))
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} doit être un nombre")
+    status = source.get('business_status')
+    if status:
+        params['business_status'] = {s.strip().upper() for s in str(status).split(',') if s.strip()}
+    return params
+
+
+def rank_results(entreprises, location, radius_m, params=None):
+    # Ajoute distance_km, retire les lieux hors du rayon réel (Nearby Search
+    # traite le rayon comme une préférence), applique filtres et tri.
+    # Sans tri demandé, l'ordre d'origine (pertinence Google) est conservé.
+    params = params or {}
+    if not entreprises:
+        return []
+    import numpy as np
+    distance = distances_km(entreprises, location)
+    rating = _floats(entreprises, 'rating')
+    total = _floats(entreprises, 'total_ratings')
+    status = np.array([entreprise.get('business_status') or '' for entreprise in entreprises])
+
+    # Les comparaisons avec NaN valent False : on ne garde une ligne sans
+    # coordonnées que tant qu'aucun filtre de distance explicite n'est demandé
+    keep = ~(distance > radius_m / 1000)
+    if 'max_distance' in params:
+        keep &= distance <= params['max_distance']
+    if 'min_rating' in params:
+        keep &= rating >= params['min_rating']
+    if 'min_ratings' in params:
+        keep &= total >= params['min_ratings']
+    if 'business_status' in params:
+        keep &= np.isin(status, list(params['business_status']))
+
+    indices = np.flatnonzero(keep)
+    if params.get('sort'):
+        columns = {
+            'distance': distance,
+            'rating': rating,
+            'total_ratings': total,
+            'business_status': np.unique(status, return_inverse=True)[1].astype(float)
+        }
+        sort_columns = []
+        for key in params['sort']:
+            column = columns[key.lstrip('-')][indices]
+            column = -column if key.startswith('-') else column
+            # NaN en dernier quel que soit le sens
+            sort_columns.append(np.where(np.isnan(column), np.inf, column))
+        # lexsort trie sur la dernière clé d'abord : la première clé demandée est prioritaire
+        indices = indices[np.lexsort(sort_columns[::-1])]
+
+    return [
+        dict(entreprises[i], distance_km=None if np.isnan(distance[i]) else round(float(distance[i]), 3))
+        for i in indices
+    ]
@@ -0,0 +1,81 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from cache_store import SQLiteCache
+from text_utils import normalize_text
+from worker_pool import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Réponse servie telle quelle pendant SEARCH_CACHE_FRESH_TTL secondes, puis
+# servie périmée (et rafraîchie en arrière-plan) jusqu'à SEARCH_CACHE_STALE_TTL
+SEARCH_CACHE_FRESH_TTL = int(os.getenv('SEARCH_CACHE_FRESH_TTL', '300'))
+SEARCH_CACHE_STALE_TTL = int(os.getenv('SEARCH_CACHE_STALE_TTL', '3600'))
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '500'))
+# Précision des coordonnées dans la clé (3 décimales ≈ 100 m)
+SEARCH_CACHE_COORD_DECIMALS = int(os.getenv('SEARCH_CACHE_COORD_DECIMALS', '3'))
+
+
+def search_cache_key(keyword, location, radius, fields, mode='nearby'):
+    return '|'.join([
+        normalize_text(keyword),
+        f"{round(location['lat'], SEARCH_CACHE_COORD_DECIMALS)},{round(location['lng'], SEARCH_CACHE_COORD_DECIMALS)}",
+        str(int(radius)),
+        ','.join(sorted(fields)),
+        mode or 'nearby'
+    ])
+
+
+class SearchResponseCache:
+    # Cache de réponses complètes avec stale-while-revalidate. Les recherches
+    # identiques simultanées d'un même processus partagent une seule
+    # exécution (single-flight) ; le stockage SQLite est commun aux workers.
+
+    def __init__(self, fresh_ttl=SEARCH_CACHE_FRESH_TTL, stale_ttl=SEARCH_CACHE_STALE_TTL, max_entries=SEARCH_CACHE_SIZE):
+        self.fresh_ttl = fresh_ttl
+        self.store = SQLiteCache('search_responses', stale_ttl, max_entries)
+        self._flights = SingleFlight()
+
+    def _run_flight(self, key, compute, keep=None):
+        def compute_and_store():
+            value = compute()
+            # Les résultats vides (erreur en amont, clé invalide...) ou
+            # incomplets (keep renvoie False) ne sont pas conservés
+            if value and (keep is None or keep(value)):
+                self.store.set(key, {'stored_at': time.time(), 'value': value})
+            return value
+        return self._flights.run(key, compute_and_store)
+
+    def _refresh_in_background(self, key, compute, keep=None):
+        if self._flights.in_flight(key):
+            return
+
+        def refresh():
+            try:
+                self._run_flight(key, compute, keep)
+            except Exception as e:
+                logger.error(f"Erreur lors du rafraîchissement du cache de recherche: {str(e)}")
+
+        # Le rafraîchissement reste imputé au budget de la requête qui l'a déclenché
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(refresh,), daemon=True).start()
+
+    def get_or_compute(self, key, compute, bypass=False, keep=None):
+        # Retourne (valeur, statut) avec statut parmi hit, stale, miss, coalesced, bypass
+        if not bypass:
+            entry = self.store.get(key)
+            if entry is not None:
+                if time.time() - entry['stored_at'] < self.fresh_ttl:
+                    return entry['value'], 'hit'
+                self._refresh_in_background(key, compute, keep)
+                return entry['value'], 'stale'
+
+        value, owner = self._run_flight(key, compute, keep)
+        if bypass:
+            return value, 'bypass'
+        return value, 'miss' if owner else 'coalesced'
+
+    def stats(self):
+        return self.store.stats()
@@ -0,0 +1,130 @@
+import gzip
+import os
+from cache_store import SQLiteCache
+
+try:
+    import brotli
+except ImportError:  # dépendance optionnelle : gzip seul sans elle
+    brotli = None
+
+# Entreprises renvoyées par les recherches, conservées côté serveur par
+# place_id : les routes d'export acceptent une liste de place_ids au lieu de
+# recevoir à nouveau les résultats complets.
+RESULTS_CACHE_TTL = int(os.getenv('RESULTS_CACHE_TTL', str(24 * 3600)))
+RESULTS_CACHE_SIZE = int(os.getenv('RESULTS_CACHE_SIZE', '50000'))
+# Compression des réponses : taille minimale et niveaux
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/plain', 'text/html', 'text/csv')
+
+results_cache = SQLiteCache('results', RESULTS_CACHE_TTL, RESULTS_CACHE_SIZE)
+
+# Champs projetables d'une entreprise (fields=)
+ENTREPRISE_FIELDS = (
+    'id', 'name', 'address', 'phone', 'website', 'rating', 'total_ratings', 'opening_hours',
+    'business_status', 'lat', 'lng', 'enriched', 'alreadyExported', 'distance_km', 'degraded',
+    'keywords', 'cities'
+)
+
+
+def remember_results(entreprises):
+    # L'état d'export Notion est recalculé au moment de l'export, pas mémorisé
+    results_cache.set_many(
+        (entreprise['id'], {k: v for k, v in entreprise.items() if k != 'alreadyExported'})
+        for entreprise in entreprises if entreprise
+    )
+
+
+def resolve_results(place_ids):
+    # (entreprises dans l'ordre demandé, place_ids inconnus ou expirés)
+    found = results_cache.get_many(str(place_id) for place_id in place_ids)
+    rows = [found[str(place_id)] for place_id in place_ids if str(place_id) in found]
+    missing = [str(place_id) for place_id in place_ids if str(place_id) not in found]
+    return rows, missing
+
+
+def parse_projection(fields, layout=None):
+    # fields=id,name,phone ; layout=columns pour le format en colonnes.
+    # ValueError si un champ ou le format est inconnu.
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+    fields = list(dict.fromkeys(fields or []))
+    unknown = [field for field in fields if field not in ENTREPRISE_FIELDS]
+    if unknown:
+        raise ValueError(f"Champs inconnus : {', '.join(unknown)}")
+    if layout not in (None, '', 'rows', 'columns'):
+        raise ValueError("layout doit valoir 'rows' ou 'columns'")
+    return {'fields': fields or None, 'layout': layout or 'rows'}
+
+
+def project(entreprise, fields):
+    if not fields:
+        return entreprise
+    return {field: entreprise.get(field) for field in fields}
+
+
+def shape_results(entreprises, projection=None):
+    # Liste d'entreprises projetées, ou en colonnes :
+    # {"fields": [...], "columns": {"name": [...], ...}, "count": n}
+    projection = projection or {'fields': None, 'layout': 'rows'}
+    fields = projection['fields']
+    if projection['layout'] != 'columns':
+        return [project(entreprise, fields) for entreprise in entreprises]
+    if not fields:
+        fields = list(dict.fromkeys(key for entreprise in entreprises for key in entreprise))
+    return {
+        'fields': fields,
+        'columns': {field: [entreprise.get(field) for entreprise in entreprises] for field in fields},
+        'count': len(entreprises)
+    }
+
+
+def accepted_encodings(header):
+    # {"gzip": 1.0, "br": 0.8, ...} d'après Accept-Encoding (q=0 exclut)
+    encodings = {}
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[name.strip().lower()] = quality
+    return {name: quality for name, quality in encodings.items() if quality > 0}
+
+
+def compress_response(response, accept_encoding):
+    # Compression brotli (si le module est installé) ou gzip des réponses
+    # complètes assez volumineuses ; les flux et fichiers restent tels quels.
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    encodings = accepted_encodings(accept_encoding)
+    if brotli is not None and 'br' in encodings:
+        encoding = 'br'
+    elif 'gzip' in encodings:
+        encoding = 'gzip'
+    else:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # Le corps envoyé diffère selon l'encodage : l'ETag devient faible
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,189 @@
+import os
+from datetime import datetime
+import upstream
+from export_manifest import export_manifest
+
+# Nombre de lignes envoyées par appel values.update pour les gros exports
+SHEETS_CHUNK_ROWS = int(os.getenv('SHEETS_CHUNK_ROWS', '500'))
+
+SHEET_TITLE = 'Liste Prospects'
+
+# (en-tête, champ de l'entreprise, largeur de colonne en pixels)
+SHEET_COLUMNS = [
+    ('ID', 'id', 120),
+    ('Nom Entreprise', 'name', 220),
+    ('Adresse Complète', 'address', 300),
+    ('Téléphone', 'phone', 140),
+    ('Site Web', 'website', 220),
+    ('Type d\'établissement', 'keyword', 160),
+    ('Note Google', 'rating', 100),
+    ('Nombre d\'avis', 'total_ratings', 110),
+    ('Horaires d\'ouverture', 'opening_hours', 260),
+    ('Email (à compléter)', None, 200),
+    ('Statut Contact', None, 140),
+    ('Notes/Commentaires', None, 260)
+]
+
+HEADER_FORMAT = {
+    "backgroundColor": {"red": 0.2, "green": 0.2, "blue": 0.2},
+    "textFormat": {"foregroundColor": {"red": 1, "green": 1, "blue": 1}, "bold": True},
+    "horizontalAlignment": "CENTER"
+}
+BODY_FORMAT = {
+    "backgroundColor": {"red": 1, "green": 1, "blue": 1},
+    "textFormat": {"foregroundColor": {"red": 0, "green": 0, "blue": 0}},
+    "verticalAlignment": "MIDDLE",
+    "wrapStrategy": "WRAP"
+}
+
+
+def sheet_row(item):
+    # Valeurs dans l'ordre des en-têtes, quel que soit l'ordre des clés reçues
+    row = []
+    for _, key, _ in SHEET_COLUMNS:
+        value = item.get(key, '') if key else ''
+        if isinstance(value, list):
+            value = '\n'.join(str(v) for v in value)
+        row.append('' if value is None else str(value))
+    return row
+
+
+def format_requests(sheet_id, row_count):
+    # Titre, taille de grille, ligne figée, formats, filtre et largeurs en une seule requête
+    column_count = len(SHEET_COLUMNS)
+    requests = [
+        {
+            "updateSheetProperties": {
+                "properties": {
+                    "sheetId": sheet_id,
+                    "title": SHEET_TITLE,
+                    "gridProperties": {
+                        "rowCount": max(row_count, 2),
+                        "columnCount": column_count,
+                        "frozenRowCount": 1
+                    }
+                },
+                "fields": "title,gridProperties(rowCount,columnCount,frozenRowCount)"
+            }
+        },
+        {
+            "repeatCell": {
+                "range": {"sheetId": sheet_id, "startRowIndex": 0, "endRowIndex": 1,
+                          "startColumnIndex": 0, "endColumnIndex": column_count},
+                "cell": {"userEnteredFormat": HEADER_FORMAT},
+                "fields": "userEnteredFormat(backgroundColor,textFormat,horizontalAlignment)"
+            }
+        },
+        {
+            "setBasicFilter": {
+                "filter": {
+                    "range": {"sheetId": sheet_id, "startRowIndex": 0, "endRowIndex": row_count,
+                              "startColumnIndex": 0, "endColumnIndex": column_count}
+                }
+            }
+        }
+    ]
+    if row_count > 1:
+        requests.append({
+            "repeatCell": {
+                "range": {"sheetId": sheet_id, "startRowIndex": 1, "endRowIndex": row_count,
+                          "startColumnIndex": 0, "endColumnIndex": column_count},
+                "cell": {"userEnteredFormat": BODY_FORMAT},
+                "fields": "userEnteredFormat(backgroundColor,textFormat,verticalAlignment,wrapStrategy)"
+            }
+        })
+    for index, (_, _, width) in enumerate(SHEET_COLUMNS):
+        requests.append({
+            "updateDimensionProperties": {
+                "range": {"sheetId": sheet_id, "dimension": "COLUMNS", "startIndex": index, "endIndex": index + 1},
+                "properties": {"pixelSize": width},
+                "fields": "pixelSize"
+            }
+        })
+    return requests
+
+
+def body_format_requests(sheet_id, start_row, end_row):
+    # Format des lignes de données et filtre étendus jusqu'à end_row
+    column_count = len(SHEET_COLUMNS)
+    return [
+        {
+            "repeatCell": {
+                "range": {"sheetId": sheet_id, "startRowIndex": start_row, "endRowIndex": end_row,
+                          "startColumnIndex": 0, "endColumnIndex": column_count},
+                "cell": {"userEnteredFormat": BODY_FORMAT},
+                "fields": "userEnteredFormat(backgroundColor,textFormat,verticalAlignment,wrapStrategy)"
+            }
+        },
+        {
+            "setBasicFilter": {
+                "filter": {
+                    "range": {"sheetId": sheet_id, "startRowIndex": 0, "endRowIndex": end_row,
+                              "startColumnIndex": 0, "endColumnIndex": column_count}
+                }
+            }
+        }
+    ]
+
+
+def write_values(worksheet, first_row, rows):
+    for start in range(0, len(rows), SHEETS_CHUNK_ROWS):
+        chunk = rows[start:start + SHEETS_CHUNK_ROWS]
+        upstream.call('google_sheets', 'values.update', lambda: worksheet.update(f'A{first_row + start}', chunk))
+
+
+def write_prospects_sheet(client, data, source):
+    # Crée le classeur, applique toute la mise en forme en un batch_update,
+    # puis écrit les valeurs par blocs de SHEETS_CHUNK_ROWS lignes.
+    # Chaque entreprise est consignée dans le manifeste avec son numéro de ligne.
+    sheet_name = f'Prospection_{source}_{datetime.now().strftime("%d-%m-%Y")}'
+    # Une création réessayée pourrait produire deux classeurs
+    spreadsheet = upstream.call('google_sheets', 'create', lambda: client.create(sheet_name), retries=0)
+    worksheet = spreadsheet.sheet1
+
+    values = [[header for header, _, _ in SHEET_COLUMNS]] + [sheet_row(item) for item in data]
+
+    # La grille est redimensionnée avant l'écriture des valeurs
+    upstream.call('google_sheets', 'batch_update',
+                  lambda: spreadsheet.batch_update({"requests": format_requests(worksheet.id, len(values))}))
+
+    write_values(worksheet, 1, values)
+
+    # Partager le spreadsheet
+    upstream.call('google_sheets', 'share', lambda: spreadsheet.share(None, perm_type='anyone', role='reader'))
+
+    # Les données commencent ligne 2, sous les en-têtes
+    export_manifest.record(f'sheets:{spreadsheet.id}', ((item, row) for row, item in enumerate(data, start=2)))
+    return {'url': spreadsheet.url, 'spreadsheet_id': spreadsheet.id,
+            'added': len(data), 'updated': 0, 'unchanged': 0}
+
+
+def append_prospects_sheet(client, spreadsheet_id, data):
+    # Export incrémental vers un classeur déjà créé : les entreprises
+    # nouvelles sont ajoutées à la suite, les modifiées réécrites sur leur
+    # ligne d'origine (d'après le manifeste), les inchangées ignorées.
+    destination = f'sheets:{spreadsheet_id}'
+    new, changed, unchanged = export_manifest.changes(destination, data)
+    new = list({item.get('id'): item for item in new}.values())
+
+    spreadsheet = upstream.call('google_sheets', 'open', lambda: client.open_by_key(spreadsheet_id), hedge=True)
+    worksheet = spreadsheet.sheet1
+
+    if new:
+        # Les classeurs créés par l'export ont exactement autant de lignes que de valeurs
+        first_row = worksheet.row_count + 1
+        end_row = worksheet.row_count + len(new)
+        requests = [{"appendDimension": {"sheetId": worksheet.id, "dimension": "ROWS", "length": len(new)}}]
+        requests += body_format_requests(worksheet.id, first_row - 1, end_row)
+        upstream.call('google_sheets', 'batch_update', lambda: spreadsheet.batch_update({"requests": requests}))
+        write_values(worksheet, first_row, [sheet_row(item) for item in new])
+        export_manifest.record(destination, ((item, row) for row, item in enumerate(new, start=first_row)))
+
+    for start in range(0, len(changed), SHEETS_CHUNK_ROWS):
+        chunk = changed[start:start + SHEETS_CHUNK_ROWS]
+        ranges = [{'range': f'A{row}', 'values': [sheet_row(item)]} for item, row in chunk]
+        upstream.call('google_sheets', 'values.batch_update', lambda: worksheet.batch_update(ranges))
+        export_manifest.record(destination, chunk)
+
+    return {'url': spreadsheet.url, 'spreadsheet_id': spreadsheet.id,
+            'added': len(new), 'updated': len(changed), 'unchanged': len(unchanged)}
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+from collections import deque
+from functools import lru_cache
+from constants import KEYWORD_SUGGESTIONS
+from text_utils import normalize_text
+
+DEFAULT_CATEGORY = 'Autre'
+DEFAULT_EMOJI = '🏢'
+# Nombre de suggestions renvoyées par défaut par /suggestions?q=
+SUGGESTIONS_LIMIT = int(os.getenv('SUGGESTIONS_LIMIT', '10'))
+
+
+class _Node:
+    __slots__ = ('children', 'value', 'fail')
+
+    def __init__(self):
+        self.children = {}
+        self.value = None
+        self.fail = None
+
+
+class KeywordTaxonomy:
+    # KEYWORD_SUGGESTIONS compilé une fois au chargement, sur texte normalisé
+    # (sans accents ni casse) :
+    #  - un automate Aho-Corasick des mots-clés pour catégoriser un texte en
+    #    un seul passage : première catégorie de KEYWORD_SUGGESTIONS dont un
+    #    mot-clé apparaît dans le texte ;
+    #  - un trie des préfixes pour l'autocomplétion, dont chaque nœud porte
+    #    déjà la liste triée des suggestions (début de mot-clé, puis début
+    #    d'un mot suivant).
+
+    def __init__(self, suggestions=KEYWORD_SUGGESTIONS):
+        self.categories = list(suggestions)
+        self.entries = []
+        self._matcher = _Node()
+        self._prefixes = _Node()
+
+        for rank, (category, data) in enumerate(suggestions.items()):
+            for keyword in data['keywords']:
+                normalized = normalize_text(keyword)
+                if not normalized:
+                    continue
+                index = len(self.entries)
+                self.entries.append({'keyword': keyword, 'category': category, 'emoji': data['emoji']})
+
+                node = self._insert(self._matcher, normalized)
+                if node.value is None or rank < node.value:
+                    node.value = rank
+
+                # Chaque début de mot du mot-clé est un point d'entrée de l'autocomplétion
+                starts = [0] + [i + 1 for i, c in enumerate(normalized) if c == ' ']
+                for start in starts:
+                    node = self._prefixes
+                    for char in normalized[start:]:
+                        node = node.children.setdefault(char, _Node())
+                        node.value = node.value or []
+                        node.value.append((start > 0, index))
+
+        self._link(self._matcher)
+        self._finalize(self._prefixes)
+
+    def _insert(self, root, text):
+        node = root
+        for char in text:
+            node = node.children.setdefault(char, _Node())
+        return node
+
+    def _link(self, root):
+        # Liens d'échec en largeur : fail pointe vers le plus long suffixe
+        # du chemin qui est aussi un préfixe de mot-clé. value devient le
+        # meilleur rang parmi tous les mots-clés qui finissent sur ce nœud.
+        root.fail = root
+        queue = deque()
+        for child in root.children.values():
+            child.fail = root
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in node.children.items():
+                fail = node.fail
+                while fail is not root and char not in fail.children:
+                    fail = fail.fail
+                child.fail = fail.children.get(char, root)
+                if child.fail is child:
+                    child.fail = root
+                queue.append(child)
+            inherited = node.fail.value
+            if inherited is not None and (node.value is None or inherited < node.value):
+                node.value = inherited
+
+    def _finalize(self, root):
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node.value:
+                seen = set()
+                ordered = []
+                for _, index in sorted(node.value):
+                    if index not in seen:
+                        seen.add(index)
+                        ordered.append(index)
+                node.value = ordered
+            stack.extend(node.children.values())
+
+    def match(self, text):
+        # Rang de catégorie du mot-clé reconnu dans text, ou None
+        root = self._matcher
+        node = root
+        best = None
+        for char in normalize_text(text):
+            while node is not root and char not in node.children:
+                node = node.fail
+            node = node.children.get(char, root)
+            if node.value is not None and (best is None or node.value < best):
+                best = node.value
+        return best
+
+    def category(self, text):
+        rank = self.match(text)
+        return self.categories[rank] if rank is not None else DEFAULT_CATEGORY
+
+    def category_and_emoji(self, text):
+        rank = self.match(text)
+        if rank is None:
+            return DEFAULT_CATEGORY, DEFAULT_EMOJI
+        category = self.categories[rank]
+        return category, KEYWORD_SUGGESTIONS[category]['emoji']
+
+    def suggest(self, query, limit=SUGGESTIONS_LIMIT):
+        node = self._prefixes
+        for char in normalize_text(query):
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return [self.entries[index] for index in (node.value or [])[:limit]]
+
+
+taxonomy = KeywordTaxonomy()
+
+
+def _etag(body):
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+
+# Réponse complète de /suggestions, sérialisée une seule fois
+SUGGESTIONS_JSON = json.dumps(KEYWORD_SUGGESTIONS, ensure_ascii=False)
+SUGGESTIONS_ETAG = _etag(SUGGESTIONS_JSON)
+
+
+@lru_cache(maxsize=2048)
+def suggestions_json(query, limit=SUGGESTIONS_LIMIT):
+    # (corps JSON, ETag) de /suggestions?q=, mémorisés par requête normalisée
+    if not query:
+        return SUGGESTIONS_JSON, SUGGESTIONS_ETAG
+    body = json.dumps(taxonomy.suggest(query, limit), ensure_ascii=False)
+    return body, _etag(body)
@@ -0,0 +1,11 @@
+import re
+import unicodedata
+
+_SEPARATORS = re.compile(r"[\s\-'’,./]+")
+
+
+def normalize_text(text):
+    # Minuscules, sans accents, tirets et apostrophes remplacés par des espaces
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _SEPARATORS.sub(' ', text.casefold()).strip()
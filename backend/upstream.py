@@ -0,0 +1,339 @@
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from metrics import Counter, REGISTRY, upstream_call
+
+logger = logging.getLogger(__name__)
+
+# Couche commune des appels Google Maps, Notion et Google Sheets : réessais
+# selon la classe d'erreur, requête doublée au-delà du p95 observé,
+# coupe-circuit par service et délai tiré du temps restant à la requête HTTP.
+UPSTREAM_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', '2'))
+UPSTREAM_RETRY_BASE_DELAY = float(os.getenv('UPSTREAM_RETRY_BASE_DELAY', '0.25'))
+UPSTREAM_RETRY_MAX_DELAY = float(os.getenv('UPSTREAM_RETRY_MAX_DELAY', '5'))
+# Requête doublée quand la première dépasse ce quantile des latences récentes
+UPSTREAM_HEDGE_QUANTILE = float(os.getenv('UPSTREAM_HEDGE_QUANTILE', '0.95'))
+UPSTREAM_HEDGE_MIN_MS = float(os.getenv('UPSTREAM_HEDGE_MIN_MS', '250'))
+UPSTREAM_HEDGE_MIN_SAMPLES = int(os.getenv('UPSTREAM_HEDGE_MIN_SAMPLES', '20'))
+# Coupe-circuit : ouvert après N échecs consécutifs, une tentative d'essai après le délai
+UPSTREAM_BREAKER_FAILURES = int(os.getenv('UPSTREAM_BREAKER_FAILURES', '5'))
+UPSTREAM_BREAKER_COOLDOWN = float(os.getenv('UPSTREAM_BREAKER_COOLDOWN', '30'))
+# Temps total accordé à une requête de recherche (secondes, 0 = sans limite)
+REQUEST_DEADLINE_S = float(os.getenv('REQUEST_DEADLINE_S', '25'))
+# En deçà de ce temps restant, un appel n'est plus lancé
+UPSTREAM_MIN_CALL_S = float(os.getenv('UPSTREAM_MIN_CALL_S', '0.2'))
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', '64'))
+
+RETRYABLE_HTTP_STATUS = {408, 429, 500, 502, 503, 504}
+# Statuts Google Maps (ApiError.status) qui valent une nouvelle tentative
+RETRYABLE_API_STATUS = {'UNKNOWN_ERROR', 'OVER_QUERY_LIMIT'}
+# Erreurs réseau des différents clients (googlemaps, requests, httpx, notion-client)
+_TRANSPORT_ERRORS = {'Timeout', 'TimeoutError', 'TimeoutException', 'TransportError',
+                     'RequestTimeoutError', 'ConnectionError'}
+
+upstream_events = Counter('api_finder_upstream_events_total',
+                          'Réessais, requêtes doublées, délais dépassés et coupe-circuits', ('service', 'event'))
+REGISTRY.append(upstream_events)
+
+
+class UpstreamError(Exception):
+    def __init__(self, service, message):
+        super().__init__(message)
+        self.service = service
+
+
+class CircuitOpen(UpstreamError):
+    pass
+
+
+class DeadlineExceeded(UpstreamError):
+    pass
+
+
+request_deadline = contextvars.ContextVar('upstream_deadline', default=None)
+# Lieux servis sans leurs détails pendant la requête en cours
+degraded_places = contextvars.ContextVar('degraded_places', default=None)
+
+
+def start_request(timeout=REQUEST_DEADLINE_S):
+    request_deadline.set(time.monotonic() + timeout if timeout else None)
+    degraded_places.set([])
+
+
+def remaining():
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def mark_degraded(place_id, reason):
+    places = degraded_places.get()
+    if places is not None:
+        places.append({'id': place_id, 'reason': reason})
+
+
+def degradation_reason(error):
+    if isinstance(error, CircuitOpen):
+        return 'circuit_open'
+    if isinstance(error, DeadlineExceeded):
+        return 'deadline'
+    return 'error'
+
+
+def http_status(error):
+    for status in (getattr(error, 'status', None), getattr(error, 'status_code', None),
+                   getattr(getattr(error, 'response', None), 'status_code', None)):
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_retryable(error):
+    # 429, 5xx et erreurs réseau ; jamais un 4xx, un budget épuisé ou une erreur de cette couche
+    if isinstance(error, UpstreamError):
+        return False
+    status = http_status(error)
+    if status is not None:
+        return status in RETRYABLE_HTTP_STATUS
+    if getattr(error, 'status', None) in RETRYABLE_API_STATUS:
+        return True
+    return any(cls.__name__ in _TRANSPORT_ERRORS for cls in type(error).__mro__)
+
+
+def retry_delay(error, attempt, base_delay=UPSTREAM_RETRY_BASE_DELAY):
+    # Retry-After si le service le fournit, sinon backoff exponentiel avec jitter complet
+    headers = getattr(error, 'headers', None) or getattr(getattr(error, 'response', None), 'headers', None)
+    if headers:
+        retry_after = headers.get('retry-after')
+        if retry_after:
+            try:
+                return float(retry_after) + random.uniform(0, base_delay)
+            except ValueError:
+                pass
+    return random.uniform(0, min(UPSTREAM_RETRY_MAX_DELAY, base_delay * (2 ** attempt)))
+
+
+class LatencyWindow:
+    # Dernières latences réussies d'une opération, pour le seuil de doublement
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q):
+        with self._lock:
+            if len(self._samples) < UPSTREAM_HEDGE_MIN_SAMPLES:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class CircuitBreaker:
+    # closed -> open après `failures` échecs consécutifs ; après `cooldown`
+    # secondes, un seul appel d'essai (half_open) décide de la réouverture
+
+    def __init__(self, service, failures=UPSTREAM_BREAKER_FAILURES, cooldown=UPSTREAM_BREAKER_COOLDOWN):
+        self.service = service
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = 'half_open'
+                self._trial = False
+            if self.state == 'half_open':
+                if self._trial:
+                    return False
+                self._trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info(f"Coupe-circuit {self.service} refermé")
+            self.state = 'closed'
+            self.failures = 0
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                if self.state != 'open':
+                    logger.warning(f"Coupe-circuit {self.service} ouvert après {self.failures} échecs")
+                    upstream_events.inc(service=self.service, event='breaker_open')
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+    def release(self):
+        # Autorisation rendue sans appel effectué (budget refusé, délai écoulé
+        # localement) : ni succès ni échec, l'essai half_open reste disponible
+        with self._lock:
+            self._trial = False
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures}
+
+
+_breakers = {}
+_latencies = {}
+_registry_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=UPSTREAM_POOL_SIZE, thread_name_prefix='upstream')
+
+
+def _breaker(service):
+    with _registry_lock:
+        if service not in _breakers:
+            _breakers[service] = CircuitBreaker(service)
+        return _breakers[service]
+
+
+def _latency(service, operation):
+    with _registry_lock:
+        return _latencies.setdefault((service, operation), LatencyWindow())
+
+
+def breaker_states():
+    with _registry_lock:
+        breakers = dict(_breakers)
+    return {service: breaker.snapshot() for service, breaker in breakers.items()}
+
+
+def _attempt(service, operation, func, hedge, timeout):
+    # Une tentative : directe, ou dans le pool quand il faut pouvoir
+    # l'abandonner au délai ou la doubler au-delà du p95
+    latency = _latency(service, operation)
+
+    def run():
+        started = time.perf_counter()
+        with upstream_call(service, operation):
+            result = func()
+        latency.add(time.perf_counter() - started)
+        return result
+
+    hedge_after = None
+    if hedge:
+        p95 = latency.quantile(UPSTREAM_HEDGE_QUANTILE)
+        if p95 is not None:
+            hedge_after = max(p95, UPSTREAM_HEDGE_MIN_MS / 1000)
+    if timeout is None and hedge_after is None:
+        return run()
+
+    context = contextvars.copy_context()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    # Le seuil de doublement court depuis le début réel de l'appel principal,
+    # pas depuis sa mise en file dans le pool
+    started = []
+
+    def primary_run():
+        started.append(time.monotonic())
+        return run()
+
+    primary = _executor.submit(context.copy().run, primary_run)
+    pending = {primary}
+    hedged = False
+    while True:
+        now = time.monotonic()
+        left = None if deadline is None else max(0.0, deadline - now)
+        wait_for = left
+        if not hedged and hedge_after is not None:
+            hedge_in = hedge_after if not started else max(0.0, started[0] + hedge_after - now)
+            wait_for = hedge_in if left is None else min(hedge_in, left)
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            error = future.exception()
+            if error is None:
+                if future is not primary:
+                    upstream_events.inc(service=service, event='hedge_won')
+                return future.result()
+            if not pending:
+                raise error
+        if done:
+            continue
+        if deadline is not None and time.monotonic() >= deadline:
+            upstream_events.inc(service=service, event='deadline')
+            raise DeadlineExceeded(service, f"Délai dépassé pour {service} {operation}")
+        if (not hedged and hedge_after is not None and started
+                and time.monotonic() - started[0] >= hedge_after):
+            hedged = True
+            upstream_events.inc(service=service, event='hedge')
+            pending.add(_executor.submit(context.copy().run, run))
+
+
+def call(service, operation, func, hedge=False, retries=UPSTREAM_MAX_RETRIES, base_delay=UPSTREAM_RETRY_BASE_DELAY,
+         before=None, retry_if=None):
+    # Exécute func() (sans argument) pour le compte de service. hedge=True
+    # uniquement pour les lectures idempotentes et non facturées (jamais
+    # Google Maps : chaque appel doublé serait payé deux fois) ; retries=0
+    # pour les écritures qu'un second envoi pourrait dupliquer. before() est
+    # appelé avant chaque tentative, hors chronométrage et hors délai de la
+    # tentative : imputation au budget, attente d'un limiteur local.
+    # retry_if(erreur) restreint les réessais, par exemple aux 429 pour une
+    # création qu'un délai dépassé côté client a peut-être déjà enregistrée.
+    breaker = _breaker(service)
+    attempt = 0
+    while True:
+        timeout = remaining()
+        if timeout is not None and timeout < UPSTREAM_MIN_CALL_S:
+            upstream_events.inc(service=service, event='deadline')
+            raise DeadlineExceeded(service, f"Plus de temps pour appeler {service} {operation}")
+        if not breaker.allow():
+            upstream_events.inc(service=service, event='rejected')
+            raise CircuitOpen(service, f"{service} indisponible (coupe-circuit ouvert)")
+        if before is not None:
+            try:
+                before()
+            except Exception as e:
+                breaker.release()
+                if isinstance(e, DeadlineExceeded):
+                    upstream_events.inc(service=service, event='deadline')
+                raise
+            timeout = remaining()
+            if timeout is not None and timeout < UPSTREAM_MIN_CALL_S:
+                breaker.release()
+                upstream_events.inc(service=service, event='deadline')
+                raise DeadlineExceeded(service, f"Plus de temps pour appeler {service} {operation}")
+        try:
+            result = _attempt(service, operation, func, hedge, timeout)
+        except Exception as e:
+            retryable = is_retryable(e)
+            if retryable:
+                breaker.failure()
+            elif isinstance(e, DeadlineExceeded):
+                # Délai de la requête HTTP écoulé côté serveur : rien ne dit
+                # que le service est en panne
+                breaker.release()
+            else:
+                # Le service a répondu (4xx, budget local...) : il n'est pas en panne
+                breaker.success()
+            if not retryable or attempt >= retries or (retry_if is not None and not retry_if(e)):
+                raise
+            delay = retry_delay(e, attempt, base_delay)
+            left = remaining()
+            if left is not None and delay + UPSTREAM_MIN_CALL_S > left:
+                raise
+            upstream_events.inc(service=service, event='retry')
+            logger.warning(f"{service} {operation} en échec ({str(e)}), nouvel essai dans {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        breaker.success()
+        return result
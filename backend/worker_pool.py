@@ -0,0 +1,154 @@
+import contextvars
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Nombre de threads par défaut quand l'appelant ne précise rien
+DEFAULT_CONCURRENCY = 8
+
+
+def _safe(func):
+    # Les tâches s'exécutent dans le contexte de l'appelant (identifiant de
+    # requête repris dans les journaux des threads du pool)
+    context = contextvars.copy_context()
+
+    def call(item):
+        return context.copy().run(func, item)
+
+    def run(item):
+        try:
+            return call(item)
+        except Exception as e:
+            logger.error(f"Erreur dans le pool de workers: {str(e)}")
+            return None
+    return run
+
+
+def bounded_map(func, items, max_workers=None):
+    # Exécute func sur chaque élément avec un nombre de threads borné.
+    # L'ordre des résultats suit l'ordre des éléments ; une erreur sur un
+    # élément donne None à sa position sans interrompre les autres.
+    items = list(items)
+    if not items:
+        return []
+
+    workers = max(1, min(max_workers or DEFAULT_CONCURRENCY, len(items)))
+    run = _safe(func)
+
+    if workers == 1:
+        return [run(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, items))
+
+
+def bounded_imap_unordered(func, items, max_workers=None):
+    # Comme bounded_map, mais produit des couples (index, résultat) dès
+    # qu'un élément est terminé.
+    items = list(items)
+    if not items:
+        return iter(())
+    return pipelined_imap_unordered(func, [items], max_workers=min(max_workers or DEFAULT_CONCURRENCY, len(items)))
+
+
+def pipelined_imap_unordered(func, batches, max_workers=None):
+    # Les lots sont consommés dans un thread dédié et leurs éléments sont
+    # soumis au pool dès qu'un lot arrive : le traitement du lot N avance
+    # pendant que le lot N+1 est encore en cours de récupération.
+    # Produit des couples (index global, résultat) dans l'ordre de fin.
+    # Une erreur sur le premier lot est relancée chez le consommateur.
+    # Si le consommateur s'arrête en route (client déconnecté), les tâches
+    # pas encore démarrées sont annulées.
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers or DEFAULT_CONCURRENCY))
+    events = queue.Queue()
+    run = _safe(func)
+    stop = threading.Event()
+
+    def produce():
+        submitted = 0
+        try:
+            for batch in batches:
+                for item in batch:
+                    if stop.is_set():
+                        return
+                    future = executor.submit(run, item)
+                    future.add_done_callback(
+                        lambda f, index=submitted: events.put(('result', index, None if f.cancelled() else f.result()))
+                    )
+                    submitted += 1
+        except Exception as e:
+            if submitted == 0:
+                events.put(('error', 0, e))
+                return
+            logger.error(f"Erreur lors de la récupération d'un lot: {str(e)}")
+        events.put(('done', submitted, None))
+
+    producer = threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True)
+    producer.start()
+
+    def consume():
+        received, total = 0, None
+        try:
+            while total is None or received < total:
+                kind, index, value = events.get()
+                if kind == 'error':
+                    raise value
+                if kind == 'done':
+                    total = index
+                    continue
+                received += 1
+                yield index, value
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return consume()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    # Regroupe les appels simultanés portant la même clé : le premier
+    # exécute la fonction, les suivants attendent et reçoivent son
+    # résultat (ou son exception).
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._flights
+
+    def run(self, key, func):
+        # Retourne (valeur, True si ce thread a exécuté la fonction)
+        with self._lock:
+            flight = self._flights.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._flights[key] = _Flight()
+
+        if not owner:
+            flight.done.wait()
+            if flight.error:
+                raise flight.error
+            return flight.value, False
+
+        try:
+            flight.value = func()
+            return flight.value, True
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()